@@ -0,0 +1,307 @@
+import asyncio
+import bz2
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+from metrics import ERRORS
+
+# Source query protocol (https://developer.valvesoftware.com/wiki/Server_queries)
+SIMPLE_HEADER = -1
+SPLIT_HEADER = -2
+A2S_INFO_REQUEST = b'\xFF\xFF\xFF\xFFTSource Engine Query\x00'
+A2S_PLAYER_REQUEST = b'\xFF\xFF\xFF\xFFU'
+S2C_CHALLENGE = 0x41
+A2S_INFO_RESPONSE = 0x49
+A2S_PLAYER_RESPONSE = 0x44
+NO_CHALLENGE = -1
+MAX_CHALLENGE_RETRIES = 3
+
+ServerInfo = namedtuple('ServerInfo', [
+    'protocol', 'server_name', 'map_name', 'folder', 'game', 'app_id', 'player_count', 'max_players',
+    'bot_count', 'server_type', 'platform', 'password_protected', 'vac_enabled', 'version', 'edf',
+    'port', 'steam_id', 'stv_port', 'stv_name', 'keywords', 'game_id', 'ping'
+])
+Player = namedtuple('Player', ['index', 'name', 'score', 'duration'])
+
+
+class QueryError(Exception):
+    pass
+
+
+class ParseError(QueryError):
+    pass
+
+
+class _Reader:
+    # Little-endian reader over a response payload
+    def __init__(self, data, encoding):
+        self.data = data
+        self.pos = 0
+        self.encoding = encoding
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        if self.pos + size > len(self.data):
+            raise ParseError("Response truncated")
+        value = struct.unpack_from(fmt, self.data, self.pos)[0]
+        self.pos += size
+        return value
+
+    def byte(self):
+        return self.unpack('<B')
+
+    def short(self):
+        return self.unpack('<h')
+
+    def long(self):
+        return self.unpack('<l')
+
+    def float(self):
+        return self.unpack('<f')
+
+    def longlong(self):
+        return self.unpack('<Q')
+
+    def char(self):
+        return chr(self.byte())
+
+    def string(self):
+        end = self.data.find(b'\x00', self.pos)
+        if end == -1:
+            raise ParseError("Unterminated string")
+        value = self.data[self.pos:end].decode(self.encoding, errors='replace')
+        self.pos = end + 1
+        return value
+
+    def remaining(self):
+        return len(self.data) - self.pos
+
+
+def parse_info(payload, encoding='utf-8', ping=0.0):
+    # Parse an A2S_INFO response body (without the header and type byte)
+    reader = _Reader(payload, encoding)
+    protocol = reader.byte()
+    server_name = reader.string()
+    map_name = reader.string()
+    folder = reader.string()
+    game = reader.string()
+    app_id = reader.short() & 0xFFFF
+    player_count = reader.byte()
+    max_players = reader.byte()
+    bot_count = reader.byte()
+    server_type = reader.char()
+    platform = reader.char()
+    password_protected = reader.byte() == 1
+    vac_enabled = reader.byte() == 1
+    if app_id == 2400:
+        # The Ship sends three extra bytes we have no use for
+        reader.byte()
+        reader.byte()
+        reader.byte()
+    version = reader.string()
+    edf = reader.byte() if reader.remaining() else 0
+    port = steam_id = stv_port = stv_name = keywords = game_id = None
+    if edf & 0x80:
+        port = reader.short() & 0xFFFF
+    if edf & 0x10:
+        steam_id = reader.longlong()
+    if edf & 0x40:
+        stv_port = reader.short() & 0xFFFF
+        stv_name = reader.string()
+    if edf & 0x20:
+        keywords = reader.string()
+    if edf & 0x01:
+        game_id = reader.longlong()
+    return ServerInfo(
+        protocol, server_name, map_name, folder, game, app_id, player_count, max_players,
+        bot_count, server_type, platform, password_protected, vac_enabled, version, edf,
+        port, steam_id, stv_port, stv_name, keywords, game_id, ping
+    )
+
+
+def parse_players(payload, encoding='utf-8'):
+    # Parse an A2S_PLAYER response body (without the header and type byte)
+    reader = _Reader(payload, encoding)
+    count = reader.byte()
+    players = []
+    for _ in range(count):
+        if not reader.remaining():
+            # Some servers report more players than they send
+            break
+        players.append(Player(reader.byte(), reader.string(), reader.long(), reader.float()))
+    return players
+
+
+class _Connection(asyncio.DatagramProtocol):
+    # One bound UDP socket to one server, with its cached challenge and outstanding requests
+    def __init__(self, client, address):
+        self.client = client
+        self.address = address
+        self.transport = None
+        self.challenge = None
+        self.pending = {}    # response type -> [future, send time, challenge retries, challenge sent]
+        self.fragments = {}  # split packet id -> {packet number: payload}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.fail_pending(exc or QueryError("Socket closed"))
+        self.client.connections.pop(self.address, None)
+
+    def error_received(self, exc):
+        # ICMP errors such as port unreachable arrive here
+        self.fail_pending(exc)
+
+    def fail_pending(self, exc):
+        for future, _, _, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+                future.exception()
+        self.pending.clear()
+
+    def build_request(self, response_type):
+        if response_type == A2S_INFO_RESPONSE:
+            if self.challenge is None:
+                return A2S_INFO_REQUEST
+            return A2S_INFO_REQUEST + struct.pack('<l', self.challenge)
+        challenge = NO_CHALLENGE if self.challenge is None else self.challenge
+        return A2S_PLAYER_REQUEST + struct.pack('<l', challenge)
+
+    def send(self, response_type):
+        entry = self.pending[response_type]
+        entry[1] = time.monotonic()
+        entry[3] = self.challenge
+        self.transport.sendto(self.build_request(response_type))
+
+    async def request(self, response_type, timeout):
+        # Concurrent requests for the same data share one round trip
+        entry = self.pending.get(response_type)
+        if entry is None:
+            entry = [asyncio.get_running_loop().create_future(), 0.0, 0, None]
+            self.pending[response_type] = entry
+            self.send(response_type)
+        future = entry[0]
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Fail everyone sharing this round trip so the next request sends a fresh one,
+            # and drop any half-received split response
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+                # Waiters get it through their own shield, mark it retrieved so it is not logged
+                future.exception()
+            self.fragments.clear()
+            raise
+        finally:
+            if future.done() and self.pending.get(response_type) is entry:
+                del self.pending[response_type]
+
+    def datagram_received(self, packet, addr):
+        if len(packet) < 5:
+            return
+        header = struct.unpack_from('<l', packet)[0]
+        if header == SIMPLE_HEADER:
+            self.handle_message(packet[4:])
+        elif header == SPLIT_HEADER:
+            message = self.reassemble(packet)
+            if message is not None:
+                self.handle_message(message)
+
+    def reassemble(self, packet):
+        # Collect a multi-packet response, returns the full message once every part arrived
+        try:
+            packet_id, total, number = struct.unpack_from('<LBB', packet, 4)
+        except struct.error:
+            return None
+        compressed = bool(packet_id & 0x80000000)
+        parts = self.fragments.setdefault(packet_id, {})
+        # Source engine split packets carry the max packet size after the packet number
+        parts[number] = packet[12:]
+        if len(parts) < total:
+            return None
+        del self.fragments[packet_id]
+        data = b''.join(parts[i] for i in range(total) if i in parts)
+        if compressed:
+            try:
+                size, crc = struct.unpack_from('<ll', data)
+                data = bz2.decompress(data[8:])
+            except (struct.error, OSError, ValueError):
+                return None
+            if len(data) != size or zlib.crc32(data) & 0xFFFFFFFF != crc & 0xFFFFFFFF:
+                return None
+        if len(data) < 4 or struct.unpack_from('<l', data)[0] != SIMPLE_HEADER:
+            return None
+        return data[4:]
+
+    def handle_message(self, message):
+        if not message:
+            # A bare header with nothing after it, from a broken server or a reassembled split
+            ERRORS.inc(where="a2s_message")
+            return
+        response_type = message[0]
+        body = message[1:]
+        if response_type == S2C_CHALLENGE:
+            self.handle_challenge(body)
+            return
+        entry = self.pending.get(response_type)
+        if entry is None or entry[0].done():
+            return
+        try:
+            if response_type == A2S_INFO_RESPONSE:
+                result = parse_info(body, self.client.encoding, time.monotonic() - entry[1])
+            else:
+                result = parse_players(body, self.client.encoding)
+        except ParseError as e:
+            entry[0].set_exception(e)
+            return
+        entry[0].set_result(result)
+
+    def handle_challenge(self, body):
+        # The server rejected our cached challenge (or we had none): store the new one and resend
+        # every outstanding request that was not already sent with it
+        if len(body) < 4:
+            return
+        self.challenge = struct.unpack_from('<l', body)[0]
+        for response_type, entry in list(self.pending.items()):
+            if entry[0].done() or entry[3] == self.challenge:
+                continue
+            entry[2] += 1
+            if entry[2] > MAX_CHALLENGE_RETRIES:
+                entry[0].set_exception(QueryError("Server keeps rejecting the challenge"))
+                continue
+            self.send(response_type)
+
+
+class QueryClient:
+    # Reusable A2S client keeping one socket per server for the lifetime of the event loop
+    def __init__(self, timeout=5, encoding='utf-8'):
+        self.timeout = timeout
+        self.encoding = encoding
+        self.connections = {}
+
+    async def connection(self, address):
+        conn = self.connections.get(address)
+        if conn is None or conn.transport is None or conn.transport.is_closing():
+            loop = asyncio.get_running_loop()
+            _, conn = await loop.create_datagram_endpoint(
+                lambda: _Connection(self, address), remote_addr=address
+            )
+            self.connections[address] = conn
+        return conn
+
+    async def info(self, address, timeout=None):
+        conn = await self.connection(address)
+        return await conn.request(A2S_INFO_RESPONSE, timeout or self.timeout)
+
+    async def players(self, address, timeout=None):
+        conn = await self.connection(address)
+        return await conn.request(A2S_PLAYER_RESPONSE, timeout or self.timeout)
+
+    def close(self):
+        for conn in list(self.connections.values()):
+            if conn.transport is not None:
+                conn.transport.close()
+        self.connections.clear()
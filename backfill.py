@@ -0,0 +1,272 @@
+import argparse
+import csv
+import glob
+import heapq
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from timeseries import (
+    CSV_HEADER, HISTORY_DIR, SAMPLES_FILE, SEGMENTS_INDEX, SETS_FILE, STRINGS_FILE, TimeSeriesStore,
+    parse_csv_row,
+)
+
+# Bulk import of old player_log.csv files, possibly from several machines with overlapping and
+# unordered time ranges, merged with the existing history into one time-ordered store:
+#   python reployer.py import logs/*.csv
+#   python backfill.py --jobs 8 --report skipped.csv machine1/ machine2/player_log.csv
+# Each file is parsed, normalised and sorted in a worker process and spilled to a temporary
+# file, then all of them and the current history are k-way merged in one pass
+
+# Samples closer together than this are one sample seen twice (two machines logging the same
+# server, or a file imported again). The logger wrote one every 5 s
+DEDUPE_WINDOW = 4
+# Parsed samples are spilled in pickled chunks of this many
+SPILL_CHUNK = 10000
+# Skipped rows kept per file for the report, the rest are only counted
+MAX_REPORTED_ROWS = 10000
+# The files a TimeSeriesStore owns, anything else in the history folder is carried over as is
+STORE_FILES = (SAMPLES_FILE, STRINGS_FILE, SETS_FILE, SEGMENTS_INDEX)
+
+
+def parse_file(path, spill_dir):
+    # Worker: parse one CSV, sort it and spill it. Returns (path, spill path, sample count,
+    # skipped count, [(line, reason, raw row)] for the first MAX_REPORTED_ROWS skipped rows,
+    # error). A file that cannot be read comes back with no spill and the error instead of
+    # taking the whole import down with it
+    try:
+        samples, skipped, reported = read_samples(path)
+    except OSError as e:
+        return path, None, 0, 0, [], f"unreadable file: {e}"
+
+    # Python's sort is stable, rows logged within one second keep their file order
+    samples.sort(key=lambda sample: sample.timestamp)
+    fd, spill_path = tempfile.mkstemp(suffix=".spill", dir=spill_dir)
+    with os.fdopen(fd, 'wb') as spill:
+        for start in range(0, len(samples), SPILL_CHUNK):
+            pickle.dump(samples[start:start + SPILL_CHUNK], spill, pickle.HIGHEST_PROTOCOL)
+    return path, spill_path, len(samples), skipped, reported, None
+
+
+def read_samples(path):
+    # Every usable row of one CSV, in file order, with the skipped count and reported rows
+    samples = []
+    skipped = 0
+    reported = []
+    with open(path, 'r', newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None:
+            rows = iter(())
+        elif 'UTC Timestamp' not in reader.fieldnames:
+            # No header line, the first row is data
+            f.seek(0)
+            reader = csv.DictReader(f, fieldnames=CSV_HEADER)
+        rows = reader
+        try:
+            for row in rows:
+                try:
+                    samples.append(parse_csv_row(row))
+                except ValueError as e:
+                    skipped += 1
+                    if len(reported) < MAX_REPORTED_ROWS:
+                        raw = [value for key, value in row.items() if key is not None and value is not None] + (row.get(None) or [])
+                        reported.append((reader.line_num, str(e), raw))
+        except csv.Error as e:
+            # A broken file keeps what was read up to the error
+            skipped += 1
+            reported.append((reader.line_num, f"unreadable: {e}", []))
+    return samples, skipped, reported
+
+
+def read_spill(spill_path):
+    with open(spill_path, 'rb') as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+
+def dedupe(samples, window=DEDUPE_WINDOW):
+    # Collapse samples within `window` seconds of the last kept one, preferring an answered
+    # query over a failed one. Returns a generator; its `dropped` count is in the stats dict
+    stats = {'dropped': 0}
+
+    def run():
+        kept = None
+        # The window runs from the first sample of a group, swapping in a later answered
+        # sample does not move it
+        start = None
+        for sample in samples:
+            if kept is not None and (sample.timestamp == start or sample.timestamp - start < window):
+                stats['dropped'] += 1
+                if kept.failed and not sample.failed:
+                    kept = sample
+                continue
+            if kept is not None:
+                yield kept
+            kept = sample
+            start = sample.timestamp
+        if kept is not None:
+            yield kept
+
+    return run(), stats
+
+
+def expand_paths(paths):
+    # Files, folders (every *.csv below them) and glob patterns
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)))
+        elif os.path.exists(path):
+            found.append(path)
+        else:
+            found.extend(sorted(glob.glob(path)))
+    # Same file named twice is parsed once
+    return list(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # Gone or unreadable, parse_file reports it
+        return 0
+
+
+def store_is_empty(directory):
+    if not os.path.exists(os.path.join(directory, SAMPLES_FILE)) and not os.path.exists(os.path.join(directory, SEGMENTS_INDEX)):
+        return True
+    store = TimeSeriesStore(directory)
+    try:
+        return len(store) == 0
+    finally:
+        store.close()
+
+
+def backfill(paths, directory=HISTORY_DIR, jobs=None, window=DEDUPE_WINDOW, progress=None):
+    # Merge the CSV files into the history at `directory`. Returns a dict of counts, with the
+    # skipped rows per file under 'skipped_rows' and the files that could not be read under
+    # 'unreadable'
+    progress = progress or (lambda message: None)
+    files = expand_paths(paths)
+    # Biggest files first so the pool is not left waiting on one large file at the end
+    files.sort(key=file_size, reverse=True)
+    spill_dir = tempfile.mkdtemp(prefix="reployer-import-")
+    report = {'files': len(files), 'parsed': 0, 'skipped': 0, 'existing': 0, 'duplicates': 0, 'written': 0, 'skipped_rows': {}, 'unreadable': {}}
+    try:
+        spills = []
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(parse_file, path, spill_dir) for path in files]
+            for future in futures:
+                path, spill_path, count, skipped, reported, error = future.result()
+                if error is not None:
+                    report['unreadable'][path] = error
+                    progress(f"{os.path.basename(path)}: skipped, {error}")
+                    continue
+                spills.append(spill_path)
+                report['parsed'] += count
+                report['skipped'] += skipped
+                if skipped:
+                    report['skipped_rows'][path] = (skipped, reported)
+                progress(f"{os.path.basename(path)}: {count} samples, {skipped} rows skipped")
+
+        # The history the app already has is one more sorted input. It is never written to in
+        # place: the merge goes to a new folder that replaces it at the end
+        existing = None if store_is_empty(directory) else TimeSeriesStore(directory)
+        target = directory if existing is None else directory.rstrip(os.sep) + ".import"
+        if existing is not None:
+            shutil.rmtree(target, ignore_errors=True)
+            report['existing'] = len(existing)
+        sources = [read_spill(spill) for spill in spills]
+        if existing is not None:
+            sources.append(existing.read())
+        merged, stats = dedupe(heapq.merge(*sources, key=lambda sample: sample.timestamp), window)
+
+        store = TimeSeriesStore(target, flush_every=SPILL_CHUNK)
+        try:
+            for sample in merged:
+                store.append(sample.timestamp, sample.player_count, sample.map_name, sample.players, sample.failed)
+                report['written'] += 1
+        finally:
+            store.close()
+            if existing is not None:
+                existing.close()
+        report['duplicates'] = stats['dropped']
+
+        if existing is not None:
+            # Carry over everything that is not part of the sample store (roster log, views)
+            for name in os.listdir(directory):
+                if name not in STORE_FILES and not name.startswith("samples-"):
+                    source = os.path.join(directory, name)
+                    if os.path.isfile(source):
+                        shutil.copy2(source, os.path.join(target, name))
+            backup = f"{directory.rstrip(os.sep)}.bak-{time.strftime('%Y%m%d-%H%M%S')}"
+            os.replace(directory, backup)
+            os.replace(target, directory)
+            report['backup'] = backup
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return report
+
+
+def write_report(report, path):
+    # Every skipped row that was kept: file, line, reason, then the row as read. Files that
+    # could not be read at all have no line
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['File', 'Line', 'Reason', 'Row'])
+        for file_path, error in report['unreadable'].items():
+            writer.writerow([file_path, '', error, ''])
+        for file_path, (_, rows) in report['skipped_rows'].items():
+            for line, reason, raw in rows:
+                writer.writerow([file_path, line, reason, ",".join(raw)])
+
+
+def main(argv=None):
+    #   python reployer.py import player_log.csv old/*.csv
+    #   python backfill.py --dir history --jobs 4 --report skipped.csv archive/
+    parser = argparse.ArgumentParser(prog="reployer import", description="Merge old player_log.csv files into the player history")
+    parser.add_argument('paths', nargs='+', help="CSV files, folders or glob patterns")
+    parser.add_argument('--dir', default=HISTORY_DIR, help="history folder (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, help="parser processes (default: one per CPU)")
+    parser.add_argument('--window', type=float, default=DEDUPE_WINDOW, help="samples closer than this many seconds are duplicates (default: %(default)s)")
+    parser.add_argument('--report', metavar='FILE', help="write the skipped rows to FILE as CSV")
+    parser.add_argument('--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args(argv)
+
+    if not expand_paths(args.paths):
+        print("No CSV files found", file=sys.stderr)
+        return 1
+    print("Stop Reployer (GUI, headless or hub) while importing, it must not write to the history meanwhile", flush=True)
+    started = time.monotonic()
+    report = backfill(args.paths, args.dir, args.jobs, args.window, None if args.quiet else lambda message: print(message, flush=True))
+
+    print(
+        f"Imported {report['files'] - len(report['unreadable'])} of {report['files']} files in {time.monotonic() - started:.1f}s: {report['parsed']} samples parsed, "
+        f"{report['skipped']} rows skipped, {report['duplicates']} duplicates dropped, "
+        f"{report['written']} samples in the history ({report['existing']} were there before)"
+    )
+    for path, (skipped, rows) in report['skipped_rows'].items():
+        reasons = {}
+        for _, reason, _ in rows:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        summary = ", ".join(f"{count} {reason}" for reason, count in sorted(reasons.items(), key=lambda item: -item[1]))
+        print(f"  {path}: {skipped} skipped ({summary}{', ...' if skipped > len(rows) else ''})")
+    for path, error in report['unreadable'].items():
+        print(f"  {path}: not imported, {error}")
+    if 'backup' in report:
+        print(f"The previous history was kept in {report['backup']}")
+    if args.report:
+        write_report(report, args.report)
+        print(f"Skipped rows written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
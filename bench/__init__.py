@@ -0,0 +1 @@
+# Benchmarks and local stand-ins for the game server and the views feed, see bench/benchmarks.py
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from bench.fake_a2s import FakeA2SServer
+from bench.fake_views import FakeViewsServer
+
+# Repeatable benchmarks of the hot paths against local fakes, nothing here talks to the live
+# server or the real views feed. Run from the repository root:
+#   python -m bench                       all benchmarks
+#   python -m bench poll views --quick    some of them, with fewer iterations
+#   python -m bench --save base.json      keep the results...
+#   python -m bench --baseline base.json  ...and fail (exit 1) when a later build is slower
+
+# A result is worse than the baseline when its p99 grew, or its throughput fell, by more than this
+DEFAULT_TOLERANCE = 0.25
+SAMPLE_SPACING = 5
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def result(name, latencies, elapsed, ops=None, unit="ops"):
+    # One line of the report, latencies in seconds, throughput in `unit` per second
+    ops = len(latencies) if ops is None else ops
+    return {
+        'name': name,
+        'ops': ops,
+        'unit': unit,
+        'throughput': ops / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies) if latencies else 0.0,
+    }
+
+
+def build_store(directory, days, now=None):
+    # A history of `days` at one sample every SAMPLE_SPACING seconds, with a few failed polls
+    from timeseries import TimeSeriesStore
+
+    now = int(time.time()) if now is None else now
+    store = TimeSeriesStore(directory)
+    if len(store) == 0:
+        for timestamp in range(now - int(days * 86400), now, SAMPLE_SPACING):
+            count = (timestamp // 600) % 17
+            names = [f"player{i}" for i in range(count)]
+            store.append(timestamp, count, "ordinance", names, timestamp % 997 == 0)
+        store.flush()
+    return store
+
+
+def bench_poll(cycles, servers=3, latency=0.002, loss=0.0):
+    # Poll cycles of the real ServerPoller against local servers: one plain, one with split
+    # player lists, one with compressed split lists, and so on
+    from poller import Server, ServerPoller
+    from a2s_client import QueryClient
+
+    fakes = []
+    for i in range(servers):
+        split = (None, 300, 300)[i % 3]
+        fakes.append(FakeA2SServer(players=24, latency=latency, jitter=latency, loss=loss, split=split, compress=i % 3 == 2).start())
+    poller = ServerPoller([Server(f"fake{i}", fake.address, 1.0) for i, fake in enumerate(fakes)], callback=None)
+    # Fetch the player list every cycle, as while the GUI shows it, so split responses are covered
+    poller.players_wanted = True
+    latencies = []
+    failures = 0
+
+    async def run():
+        nonlocal failures
+        poller.client = QueryClient(timeout=1.0)
+        try:
+            for _ in range(cycles):
+                started = time.perf_counter()
+                results = await poller.poll_once()
+                latencies.append(time.perf_counter() - started)
+                failures += sum(1 for r in results.values() if r.error is not None)
+        finally:
+            poller.client.close()
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(run())
+    finally:
+        for fake in fakes:
+            fake.stop()
+    elapsed = time.perf_counter() - started
+    line = result("poll", latencies, elapsed, unit="cycles")
+    line['failures'] = failures
+    return [line]
+
+
+def bench_logging(samples, directory):
+    # Sample logging through the write-behind writer: how long the poller thread is held by
+    # submit(), and how fast the writer gets everything to disk
+    from timeseries import TimeSeriesStore
+    from writer import WriteBehind
+
+    path = os.path.join(directory, "logging")
+    shutil.rmtree(path, ignore_errors=True)
+    store = TimeSeriesStore(path)
+    writer = WriteBehind([store], max_pending=samples + 1)
+    writer.start()
+    names = [f"player{i}" for i in range(16)]
+    now = int(time.time())
+    latencies = []
+    started = time.perf_counter()
+    for i in range(samples):
+        call_started = time.perf_counter()
+        writer.submit(store.append, now - samples + i, i % 17, "ordinance", names[:i % 17], False)
+        latencies.append(time.perf_counter() - call_started)
+    writer.close()
+    elapsed = time.perf_counter() - started
+    store.close()
+
+    # Append latency on the writer side, without the queue
+    store = TimeSeriesStore(path)
+    appends = []
+    for i in range(min(samples, 5000)):
+        call_started = time.perf_counter()
+        store.append(now + i, i % 17, "ordinance", names[:i % 17], False)
+        appends.append(time.perf_counter() - call_started)
+    store.close()
+    append_elapsed = sum(appends)
+    return [
+        result("log.submit", latencies, elapsed, unit="samples"),
+        result("log.append", appends, append_elapsed, unit="samples"),
+    ]
+
+
+def bench_history(days, repeats, directory):
+    # Loading the store into the graph history at every resolution: cold (every record read
+    # for the long-term levels) and from the cache the collector saves on stop
+    from history import CACHE_FILE, History
+
+    store = build_store(os.path.join(directory, f"history-{days}d"), days)
+    records = len(store)
+    cache_path = os.path.join(store.directory, CACHE_FILE)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    results = []
+    for name in ("history.load", "history.load.cached"):
+        latencies = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            history = History()
+            history.load(store)
+            latencies.append(time.perf_counter() - started)
+        results.append(result(name, latencies, sum(latencies), ops=records * repeats, unit="records"))
+        history.save(store)
+    store.close()
+    return results
+
+
+def graph_app(history):
+    # The GUI's graph code on an off-screen Agg canvas, without building the Tk window
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import reployer
+
+    app = reployer.ServerMonitorApp.__new__(reployer.ServerMonitorApp)
+    app.theme = {'graph_bg': "#1e1e1e", 'graph_fg': "#ffffff", 'graph_grid': "#444444", 'plot': "#4fc3f7"}
+    app.graph_window = reployer.GRAPH_RANGES[reployer.DEFAULT_GRAPH_RANGE]
+    app.graph_lock = threading.Lock()
+    app.history = history
+    app.fig = Figure(figsize=(8, 4), dpi=100)
+    app.fig.subplots_adjust(bottom=0.18)
+    app.ax = app.fig.add_subplot(111)
+    app.plot_line, = app.ax.plot([], [], color=app.theme['plot'], marker='o', animated=True)
+    app.graph_band = app.ax.fill_between([], [], [], color=app.theme['plot'], alpha=0.25, linewidth=0, animated=True)
+    app.graph_background = None
+    app.setup_graph_axes()
+    app.canvas = FigureCanvasAgg(app.fig)
+    app.canvas.mpl_connect('draw_event', app.on_graph_draw)
+    return app, reployer.GRAPH_RANGES
+
+
+def bench_graph(days, redraws, directory):
+    # Graph redraws per range: one full draw when the range is picked, then a blit per new sample
+    from history import History
+
+    store = build_store(os.path.join(directory, f"history-{days}d"), days)
+    history = History()
+    history.load(store)
+    store.close()
+    app, ranges = graph_app(history)
+    full, blit = [], []
+    started = time.perf_counter()
+    for window in ranges.values():
+        app.graph_window = window
+        call_started = time.perf_counter()
+        app.redraw_graph()
+        full.append(time.perf_counter() - call_started)
+        for _ in range(redraws):
+            history.add(time.time(), 5)
+            call_started = time.perf_counter()
+            app.redraw_graph()
+            blit.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return [
+        result("graph.full", full, sum(full), unit="draws"),
+        result("graph.blit", blit, elapsed - sum(full), unit="draws"),
+    ]
+
+
+def bench_views(bursts, burst_size):
+    # NEW_VIEW bursts through the real ViewsClient: latency from the fake sending a message to
+    # on_views handing it over, and message parsing on its own
+    from views import ViewsClient
+
+    server = FakeViewsServer(burst_size=burst_size, interval=0.2, bursts=bursts).start()
+    expected = bursts * burst_size
+    latencies = []
+    received = threading.Event()
+
+    def on_views(views):
+        now = time.time()
+        latencies.extend(now - float(view.timestamp) for view in views)
+        if len(latencies) >= expected:
+            received.set()
+
+    client = ViewsClient(server.url, lambda message: None, on_views)
+    started = time.perf_counter()
+    client.start()
+    received.wait(30 + bursts)
+    elapsed = time.perf_counter() - started
+    client.stop()
+    server.stop()
+
+    messages = [
+        json.dumps({'type': 'NEW_VIEW', 'data': {'id': str(i), 'timestamp': 1700000000 + i}})
+        for i in range(expected)
+    ]
+    parser = ViewsClient("ws://unused", lambda message: None, lambda views: None)
+    batches = []
+    for i in range(0, len(messages), burst_size):
+        call_started = time.perf_counter()
+        parser.process_messages(messages[i:i + burst_size])
+        batches.append(time.perf_counter() - call_started)
+    return [
+        result("views.delivery", latencies, elapsed, unit="messages"),
+        result("views.parse", batches, sum(batches), ops=len(messages), unit="messages"),
+    ]
+
+
+def run(names, quick, directory):
+    scale = 0.2 if quick else 1
+    benchmarks = {
+        'poll': lambda: bench_poll(max(20, int(300 * scale))),
+        'logging': lambda: bench_logging(max(1000, int(20000 * scale)), directory),
+        'history': lambda: bench_history(2 if quick else 10, 3 if quick else 5, directory),
+        'graph': lambda: bench_graph(2 if quick else 10, max(10, int(50 * scale)), directory),
+        'views': lambda: bench_views(max(3, int(10 * scale)), 200),
+    }
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark: {', '.join(unknown)} (choose from {', '.join(benchmarks)})")
+    results = []
+    for name in names or benchmarks:
+        try:
+            results.extend(benchmarks[name]())
+        except ImportError as e:
+            # graph needs matplotlib, views needs websockets
+            print(f"Skipping {name}: {e}", file=sys.stderr)
+    return results
+
+
+def print_results(results):
+    print(f"{'benchmark':<20} {'ops':>8} {'throughput':>18} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for line in results:
+        throughput = f"{line['throughput']:,.0f} {line['unit']}/s"
+        print(
+            f"{line['name']:<20} {line['ops']:>8} {throughput:>18} "
+            f"{line['p50'] * 1000:>9.3f} {line['p99'] * 1000:>9.3f} {line['max'] * 1000:>9.3f}"
+        )
+        if line.get('failures'):
+            print(f"  {line['failures']} failed queries")
+
+
+def compare(results, baseline, tolerance):
+    # Lines describing every result that regressed against the baseline
+    base = {line['name']: line for line in baseline}
+    regressions = []
+    for line in results:
+        old = base.get(line['name'])
+        if old is None:
+            continue
+        if old['p99'] and line['p99'] > old['p99'] * (1 + tolerance):
+            regressions.append(f"{line['name']}: p99 {old['p99'] * 1000:.3f} -> {line['p99'] * 1000:.3f} ms")
+        if old['throughput'] and line['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{line['name']}: throughput {old['throughput']:,.0f} -> {line['throughput']:,.0f} {line['unit']}/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Reployer benchmarks against local fake servers")
+    parser.add_argument('names', nargs='*', help="benchmarks to run: poll, logging, history, graph, views (default: all)")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations and a smaller history")
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    parser.add_argument('--save', metavar='FILE', help="write the results to FILE as a baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against a saved baseline, exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown as a fraction (default: %(default)s)")
+    parser.add_argument('--dir', help="scratch folder for generated histories (default: a temporary folder)")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp(prefix="reployer-bench-")
+    try:
+        results = run(args.names, args.quick, directory)
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_results(results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
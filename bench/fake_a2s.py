@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import bz2
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# Local stand-in for a Source dedicated server answering A2S_INFO and A2S_PLAYER, for the
+# benchmarks and for trying the app without the live server:
+#   python -m bench.fake_a2s --port 27015 --players 12 --latency 0.05 --loss 0.1 --split 400
+# Every setting is a plain attribute that can be changed while it runs, or scripted with
+# `script`: [(seconds after start, {setting: value}), ...] applied as the time comes
+
+CHALLENGE = 0x1234ABCD
+# Responses longer than this always go out as split packets, like a real server does
+MAX_PACKET = 1248
+# Max packet size field sent in split packet headers
+SPLIT_PACKET_SIZE = 1248
+
+
+def info_payload(server_name, map_name, player_count, max_players, port):
+    # A2S_INFO response: TF2 app id, dedicated linux server, EDF with the game port
+    return (
+        b'I' + bytes([17]) + server_name.encode() + b'\x00' + map_name.encode() + b'\x00'
+        + b'tf\x00' + b'Team Fortress\x00' + struct.pack('<h', 440)
+        + bytes([min(player_count, 255), max_players, 0]) + b'dl' + bytes([0, 1])
+        + b'1.0.0\x00' + bytes([0x80]) + struct.pack('<H', port)
+    )
+
+
+def players_payload(names, started):
+    body = [b'D', bytes([min(len(names), 255)])]
+    elapsed = time.monotonic() - started
+    for index, name in enumerate(names[:255]):
+        body.append(bytes([index]) + name.encode() + b'\x00' + struct.pack('<lf', index, elapsed + 60.0 * index))
+    return b''.join(body)
+
+
+def split_packets(message, size, packet_id, compress):
+    # Source multi-packet response: header -2, id, total, number, max size, payload part
+    if compress:
+        packet_id |= 0x80000000
+        message = struct.pack('<lL', len(message), zlib.crc32(message)) + bz2.compress(message)
+    parts = [message[i:i + size] for i in range(0, len(message), size)] or [b'']
+    return [
+        struct.pack('<lLBBh', -2, packet_id, len(parts), number, SPLIT_PACKET_SIZE) + part
+        for number, part in enumerate(parts)
+    ]
+
+
+class FakeA2SServer(asyncio.DatagramProtocol):
+    # Runs on its own event loop thread, start() returns once it is bound
+    def __init__(self, host="127.0.0.1", port=0, players=8, map_name="ordinance", server_name="Fake CGE7-193",
+                 max_players=24, latency=0.0, jitter=0.0, loss=0.0, split=None, compress=False,
+                 challenge=True, script=None):
+        self.host = host
+        self.port = port
+        self.players = players  # count, or a list of names
+        self.map_name = map_name
+        self.server_name = server_name
+        self.max_players = max_players
+        self.latency = latency  # seconds before each response is sent, plus up to `jitter`
+        self.jitter = jitter
+        self.loss = loss  # probability that an outgoing packet is dropped
+        self.split = split  # max payload bytes per packet, None sends single packets
+        self.compress = compress
+        self.challenge = challenge
+        self.script = sorted(script or [], key=lambda step: step[0])
+        self.random = random.Random(0)
+        self.requests = 0
+        self.sent = 0
+        self.dropped = 0
+        self.transport = None
+        self.loop = None
+        self.started = None
+        self.packet_ids = 0
+        self.ready = threading.Event()
+        self.thread = None
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: self, local_addr=(self.host, self.port))
+        )
+        self.port = transport.get_extra_info('sockname')[1]
+        self.started = time.monotonic()
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            transport.close()
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def names(self):
+        if isinstance(self.players, int):
+            return [f"player{i}" for i in range(self.players)]
+        return list(self.players)
+
+    def apply_script(self):
+        elapsed = time.monotonic() - self.started
+        while self.script and self.script[0][0] <= elapsed:
+            for name, value in self.script.pop(0)[1].items():
+                setattr(self, name, value)
+
+    def datagram_received(self, data, addr):
+        if len(data) < 5 or data[:4] != b'\xff\xff\xff\xff':
+            return
+        self.requests += 1
+        self.apply_script()
+        kind = data[4]
+        if kind == ord('T'):
+            offered = struct.unpack_from('<l', data, 25)[0] if len(data) >= 29 else None
+            if self.challenge and offered != CHALLENGE:
+                self.respond(b'A' + struct.pack('<l', CHALLENGE), addr)
+                return
+            names = self.names()
+            self.respond(info_payload(self.server_name, self.map_name, len(names), self.max_players, self.port), addr)
+        elif kind == ord('U'):
+            offered = struct.unpack_from('<l', data, 5)[0] if len(data) >= 9 else None
+            if self.challenge and offered != CHALLENGE:
+                self.respond(b'A' + struct.pack('<l', CHALLENGE), addr)
+                return
+            self.respond(players_payload(self.names(), self.started), addr)
+
+    def respond(self, payload, addr):
+        message = b'\xff\xff\xff\xff' + payload
+        if self.split and (len(message) > self.split or self.compress):
+            self.packet_ids += 1
+            packets = split_packets(message, self.split, self.packet_ids, self.compress)
+        elif len(message) > MAX_PACKET:
+            self.packet_ids += 1
+            packets = split_packets(message, MAX_PACKET, self.packet_ids, False)
+        else:
+            packets = [message]
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        for packet in packets:
+            if self.loss and self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+            if delay > 0:
+                self.loop.call_later(delay, self.send, packet, addr)
+            else:
+                self.send(packet, addr)
+
+    def send(self, packet, addr):
+        self.transport.sendto(packet, addr)
+        self.sent += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.fake_a2s", description="Fake A2S server")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=27015)
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--map', default="ordinance")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of packets dropped")
+    parser.add_argument('--split', type=int, help="split responses into packets of this many bytes")
+    parser.add_argument('--compress', action='store_true', help="bz2-compress split responses")
+    args = parser.parse_args(argv)
+    server = FakeA2SServer(
+        args.host, args.port, args.players, args.map, latency=args.latency, jitter=args.jitter,
+        loss=args.loss, split=args.split, compress=args.compress,
+    ).start()
+    print(f"Fake A2S server on {server.host}:{server.port}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+
+# Local stand-in for the views WebSocket: every client gets bursts of `burst_size` NEW_VIEW
+# messages every `interval` seconds, with increasing ids and the send time as timestamp:
+#   python -m bench.fake_views --port 8765 --burst 200 --interval 1
+# disconnect_after closes each connection after that many bursts, to exercise reconnects
+
+
+class FakeViewsServer:
+    def __init__(self, host="127.0.0.1", port=0, burst_size=100, interval=1.0, bursts=None, start_id=1, disconnect_after=None):
+        self.host = host
+        self.port = port
+        self.burst_size = burst_size
+        self.interval = interval
+        self.bursts = bursts  # per connection, None keeps sending
+        self.next_id = start_id
+        self.disconnect_after = disconnect_after
+        self.connections = 0
+        self.sent = 0
+        self.done = threading.Event()  # set once a connection has sent all its bursts
+        self.ready = threading.Event()
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        import websockets
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        async with websockets.serve(self.handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.ready.set()
+            await self.stopped.wait()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(5)
+
+    def message(self):
+        view_id = self.next_id
+        self.next_id += 1
+        return json.dumps({'type': 'NEW_VIEW', 'data': {'id': str(view_id), 'timestamp': time.time()}})
+
+    async def handler(self, websocket):
+        self.connections += 1
+        burst = 0
+        while self.bursts is None or burst < self.bursts:
+            if self.disconnect_after is not None and burst >= self.disconnect_after:
+                await websocket.close()
+                return
+            for _ in range(self.burst_size):
+                await websocket.send(self.message())
+                self.sent += 1
+            burst += 1
+            await asyncio.sleep(self.interval)
+        self.done.set()
+        await websocket.wait_closed()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.fake_views", description="Fake views WebSocket server")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--burst', type=int, default=100, help="NEW_VIEW messages per burst")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between bursts")
+    parser.add_argument('--disconnect-after', type=int, help="close each connection after this many bursts")
+    args = parser.parse_args(argv)
+    server = FakeViewsServer(args.host, args.port, args.burst, args.interval, disconnect_after=args.disconnect_after).start()
+    print(f"Fake views WebSocket on {server.url}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from map_schedule import SECOND_RESTART, load_schedule
+from metrics import ERRORS, METRICS_PORT, MetricsServer, gauge
+from poller import AdaptiveInterval, Server, ServerPoller, load_servers, ping_server
+from roster import Roster, RosterLog
+from timeseries import TimeSeriesStore, import_csv
+from views import ViewsClient
+from viewstore import ViewStore, format_gaps
+from writer import DEFAULT_FSYNC, FSYNC_POLICIES, WriteBehind
+
+# Data collection core shared by the GUI and headless mode. Nothing in here (or in the modules
+# it imports) may pull in tkinter, matplotlib or pygame.
+
+# Constants
+# CGE7_193 = ('79.127.217.197', 22912) # old server ip
+CGE7_193 = ('169.150.249.133', 22912) # new server IP since 14/08/25
+SOURCETV = ('169.150.249.133', 22913)
+TIMEOUT = 5
+UPDATE_INTERVAL = 5
+CSV_FILENAME = "player_log.csv"
+HISTORY_DIR = "history"
+VIEWS_WEBSOCKET_URL = "wss://view.gaq9.com"
+MAIN_SERVER = "CGE7-193"
+# Main server pings kept for the running average
+PING_HISTORY = 60
+# Polls can come faster than UPDATE_INTERVAL (bursts around map changes), the history only keeps
+# a sample when at least this long has passed since the last one
+MIN_SAMPLE_SPACING = UPDATE_INTERVAL * 0.8
+# The main server is OFFLINE once it has not answered for this long (outside restart windows),
+# and the status label says so after OFFLINE_LABEL_AFTER. Counted in seconds, not polls, so
+# the 0.5 s burst polls do not declare it offline ten times sooner
+OFFLINE_AFTER = 5 * UPDATE_INTERVAL
+OFFLINE_LABEL_AFTER = 15 * UPDATE_INTERVAL
+# Servers polled every cycle, override with servers.json to add mirrors
+DEFAULT_SERVERS = [
+    Server(MAIN_SERVER, CGE7_193, TIMEOUT),
+    Server("SourceTV", SOURCETV, TIMEOUT),
+]
+
+# Latest view of the main server after one poll. When a query fails, info, player_count and
+# players carry the last known values and query_ok is False. ping is this poll's info round
+# trip in seconds (None when it failed), avg_ping the average over the last PING_HISTORY polls.
+# failed_seconds is how long it has not answered, not counting restart windows
+ServerState = namedtuple('ServerState', ['info', 'player_count', 'players', 'query_ok', 'offline', 'fail_count', 'timestamp', 'ping', 'avg_ping', 'failed_seconds'])
+
+PLAYERS = gauge("reployer_players", "Players on the main server at the last answered poll")
+FAIL_COUNT = gauge("reployer_query_fail_count", "Consecutive failed polls of the main server")
+FAILED_SECONDS = gauge("reployer_query_failed_seconds", "Seconds the main server has not answered, restart windows excluded")
+OFFLINE = gauge("reployer_offline", "1 while the main server is considered offline")
+WRITER_PENDING = gauge("reployer_writer_pending", "History writes queued and not yet applied")
+
+
+class Collector:
+    # Owns the poller, the history store and the views client, and reports to listeners.
+    # Listeners are called as listener(event, *args) from background threads with one of:
+    #   "state", ServerState          after every poll of the main server
+    #   "sample", timestamp, count, failed
+    #                                 when a sample was added to the history
+    #   "roster", [RosterEvent], [RosterEntry]
+    #                                 after every answered poll and when the server goes offline
+    #   "poll", {name: PollResult}    after every poll cycle
+    #   "online_changed", offline     when the main server goes offline or comes back
+    #   "views_status", message       views WebSocket status
+    #   "views", [View]               a batch of NEW_VIEW messages, oldest first
+    #   "view_gaps", [(first, last)]  view ids missed while disconnected
+    # Metrics are served on http://127.0.0.1:metrics_port/metrics while running (None disables)
+    def __init__(self, servers=None, history_dir=HISTORY_DIR, views_url=VIEWS_WEBSOCKET_URL, main_server=MAIN_SERVER, fsync=DEFAULT_FSYNC, metrics_port=METRICS_PORT, keep_segments=None):
+        self.servers = load_servers(DEFAULT_SERVERS) if servers is None else list(servers)
+        self.main_server = main_server
+        self.listeners = []
+
+        # Main server state
+        self.server_info = None
+        self.player_list = []
+        self.player_count = 0
+        self.query_fail_count = 0
+        self.failed_seconds = 0
+        self.last_poll_time = None
+        self.offline = None  # None until the first poll
+        self.server_results = {}
+        self.pings = deque(maxlen=PING_HISTORY)  # (timestamp, seconds) of answered polls
+        self.last_sample_time = 0
+
+        # keep_segments limits the archived days of history on disk, None keeps them all
+        self.store = TimeSeriesStore(history_dir, keep_segments=keep_segments)
+        self.migrate_csv()
+        self.roster = Roster()
+        try:
+            self.roster_log = RosterLog(history_dir)
+        except OSError:
+            self.roster_log = None
+        try:
+            self.view_store = ViewStore(history_dir)
+        except OSError:
+            self.view_store = None
+        # History and roster writes happen on the writer thread, never on the poller thread
+        targets = [target for target in (self.store, self.roster_log, self.view_store) if target is not None]
+        self.writer = WriteBehind(targets, fsync=fsync)
+        WRITER_PENDING.func = self.writer.queue.qsize
+        self.metrics_server = MetricsServer(metrics_port) if metrics_port else None
+        try:
+            self.schedule = load_schedule()
+            scheduler = AdaptiveInterval(self.schedule, main_server, UPDATE_INTERVAL, burst_starts=(0, SECOND_RESTART[1]))
+        except (OSError, ValueError, KeyError):
+            # Without the rotation there are no restart windows to plan around
+            self.schedule = None
+            scheduler = None
+        self.poller = ServerPoller(self.servers, self.on_poll_results, interval=UPDATE_INTERVAL, timeout=TIMEOUT, scheduler=scheduler)
+        self.views = ViewsClient(views_url, self.on_views_status, self.on_views, self.on_views_connected, self.on_views_replayed) if views_url else None
+        # Highest view id stored when the feed last (re)connected, checked for gaps once its replay is over
+        self.view_gap_check_from = None
+        if self.views is not None and self.view_store is not None:
+            # Views replayed after a restart are not new
+            self.views.last_view_id = self.view_store.max_id()
+        # Graph history handed out by load_history(), its cache is saved on stop()
+        self.history = None
+        self.history_lock = None
+
+    def migrate_csv(self):
+        # Import an old player_log.csv on first run
+        if len(self.store) == 0 and os.path.exists(CSV_FILENAME):
+            try:
+                imported, skipped = import_csv(self.store, CSV_FILENAME)
+            except Exception as e:
+                ERRORS.inc(where="csv_import")
+                print(f"Could not import {CSV_FILENAME}, trying again next start: {e}", file=sys.stderr)
+                # A partial import would leave the store non-empty and the rest of the file
+                # would never be read, start over from an empty store instead
+                self.store.discard()
+                self.store = TimeSeriesStore(self.store.directory, keep_segments=self.store.keep_segments)
+                return
+            if skipped:
+                print(f"Imported {imported} samples from {CSV_FILENAME}, {skipped} unusable rows skipped", file=sys.stderr)
+
+    def load_history(self, lock=None):
+        # Build the graph history (history.History) from the store. `lock` is what the caller
+        # holds while adding samples to it, taken when the cache is saved
+        from history import History
+        history = History()
+        history.load(self.store)
+        self.history = history
+        self.history_lock = lock or threading.Lock()
+        return history
+
+    def save_history(self):
+        # Cache the graph history's long-term levels so the next start does not read the whole log
+        if self.history is None:
+            return
+        try:
+            with self.history_lock:
+                self.history.save(self.store)
+        except Exception:
+            ERRORS.inc(where="history_cache")
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, *args):
+        for listener in list(self.listeners):
+            try:
+                listener(event, *args)
+            except Exception:
+                ERRORS.inc(where=f"listener:{event}")
+
+    def start(self):
+        if self.metrics_server is not None and not self.metrics_server.start():
+            # Port taken, most likely by another instance, run without the endpoint
+            self.metrics_server = None
+        self.writer.start()
+        self.poller.start()
+        if self.views is not None:
+            self.views.start()
+
+    def stop(self):
+        self.poller.stop()
+        if self.views is not None:
+            self.views.stop()
+        self.writer.close()
+        self.save_history()
+        self.store.close()
+        if self.roster_log is not None:
+            self.roster_log.close()
+        if self.view_store is not None:
+            self.view_store.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
+    def main_address(self):
+        for server in self.servers:
+            if server.name == self.main_server:
+                return server.address
+        return CGE7_193
+
+    def probe(self, callback, address=None):
+        # Reachability check of the main server that never blocks the caller.
+        # Calls callback(ping, error) from a background thread, ping in seconds or None
+        address = address or self.main_address()
+
+        def run():
+            try:
+                info, ping = self.poller.submit(ping_server, address).result(TIMEOUT + 1)
+            except Exception as e:
+                callback(None, e)
+                return
+            callback(ping, None)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def set_players_wanted(self, wanted):
+        # Fetch the player list on every poll while it is on screen, see PLAYERS_INTERVAL
+        self.poller.players_wanted = wanted
+
+    def average_ping(self):
+        pings = list(self.pings)
+        return sum(ping for _, ping in pings) / len(pings) if pings else None
+
+    def on_poll_results(self, results):
+        # Handle one poll cycle on the poller thread, results keyed by server name
+        self.server_results = results
+        main_result = results.get(self.main_server)
+        if main_result is not None:
+            self.update_server_state(main_result)
+        self.emit("poll", results)
+
+    def update_server_state(self, result):
+        # Track the main server's state and log the sample
+        info, players = result.info, result.players
+        player_count = len(players)
+        query_ok = info is not None
+
+        # Each failed poll stands for the time since the previous one, whatever the interval
+        since_last = UPDATE_INTERVAL if self.last_poll_time is None else max(result.timestamp - self.last_poll_time, 0)
+        self.last_poll_time = result.timestamp
+        if info is None:
+            # A planned restart does not count towards going OFFLINE
+            if not self.in_restart_window(result.timestamp):
+                self.query_fail_count += 1
+                self.failed_seconds += since_last
+            if self.server_info is not None:
+                info = self.server_info
+            player_count = self.player_count
+            players = self.player_list
+        else:
+            self.query_fail_count = 0
+            self.failed_seconds = 0
+            self.server_info = info
+            self.player_list = players
+            self.player_count = player_count
+            self.pings.append((result.timestamp, result.ping))
+
+        # Determine current online/offline state
+        offline_now = self.failed_seconds >= OFFLINE_AFTER or (self.query_fail_count > 0 and not info)
+
+        # Only report actual state transitions, the first poll just sets the state
+        if self.offline is not None and self.offline != offline_now:
+            self.emit("online_changed", offline_now)
+        self.offline = offline_now
+        PLAYERS.set(player_count)
+        FAIL_COUNT.set(self.query_fail_count)
+        FAILED_SECONDS.set(self.failed_seconds)
+        OFFLINE.set(int(offline_now))
+
+        if query_ok and result.players_fresh:
+            self.update_roster(self.roster.update(players, result.timestamp))
+        elif offline_now and self.roster.online:
+            self.update_roster(self.roster.clear())
+
+        if result.timestamp - self.last_sample_time >= MIN_SAMPLE_SPACING:
+            self.last_sample_time = result.timestamp
+            self.log_sample(result.timestamp, player_count, info.map_name if info else "Unknown", players, not query_ok)
+            self.emit("sample", result.timestamp, player_count, not query_ok)
+        self.emit("state", ServerState(
+            info, player_count, players, query_ok, offline_now, self.query_fail_count, result.timestamp,
+            result.ping if query_ok else None, self.average_ping(), self.failed_seconds
+        ))
+
+    def in_restart_window(self, timestamp):
+        return self.schedule is not None and self.schedule.restart_type(timestamp) is not None
+
+    def log_sample(self, timestamp, player_count, map_name, players, failed):
+        # Queue one sample for the history store, failures show up in the writer's counters
+        self.writer.submit(self.store.append, timestamp, player_count, map_name, [player.name for player in players], failed)
+
+    def update_roster(self, events):
+        # Log join/leave events and report the current roster
+        if self.roster_log is not None and events:
+            self.writer.submit(self.roster_log.write, events)
+        self.emit("roster", events, self.roster.snapshot())
+
+    def on_views_status(self, message):
+        self.emit("views_status", message)
+
+    def on_views_connected(self):
+        if self.view_store is not None:
+            self.view_gap_check_from = self.view_store.max_id()
+
+    def on_views_replayed(self):
+        # Report ids the replay after a reconnect did not cover
+        if self.view_store is not None and self.view_gap_check_from is not None:
+            gaps = self.view_store.gaps(self.view_gap_check_from, self.view_store.max_id())
+            self.view_gap_check_from = None
+            if gaps:
+                self.emit("view_gaps", gaps)
+                self.on_views_status(f"Missing views: {format_gaps(gaps)}")
+
+    def on_views(self, views):
+        # Store the views
+        if self.view_store is not None:
+            for view in views:
+                try:
+                    self.view_store.add(view.view_id, view.timestamp)
+                except (TypeError, ValueError):
+                    pass
+        self.emit("views", views)
+
+
+def format_duration(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes}m"
+
+
+def print_event(event, *args):
+    # Headless output, one line per event
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if event == "state":
+        state = args[0]
+        map_name = state.info.map_name if state.info else "Unknown"
+        status = f"query ok, ping {state.ping * 1000:.0f} ms" if state.query_ok else f"query failed ({state.fail_count}, {state.failed_seconds:.0f}s)"
+        print(f"{now} | {map_name} | {state.player_count} players | {status}", flush=True)
+    elif event == "roster":
+        for roster_event in args[0]:
+            if roster_event.kind == "join":
+                print(f"{now} | {roster_event.name or 'connecting...'} joined", flush=True)
+            else:
+                print(f"{now} | {roster_event.name or 'connecting...'} left after {format_duration(roster_event.session.length)}", flush=True)
+    elif event == "online_changed":
+        print(f"{now} | server is {'OFFLINE' if args[0] else 'ONLINE'}", flush=True)
+    elif event == "views_status":
+        print(f"{now} | views: {args[0]}", flush=True)
+    elif event == "views":
+        for view in args[0]:
+            print(f"{now} | view {view.view_id} at {view.timestamp}{' (new)' if view.is_new else ''}", flush=True)
+
+
+def run_headless(argv=None):
+    # Run the collectors without any GUI until interrupted
+    parser = argparse.ArgumentParser(prog="reployer --headless")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=DEFAULT_FSYNC, help="when to fsync the history (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, metavar='PORT', help="serve metrics on 127.0.0.1:PORT, 0 to disable (default: %(default)s)")
+    parser.add_argument('--keep-segments', type=int, metavar='N', help="keep only the newest N archived history segments, about one per day (default: all)")
+    args, _ = parser.parse_known_args(argv)
+    collector = Collector(fsync=args.fsync, metrics_port=args.metrics_port, keep_segments=args.keep_segments)
+    collector.add_listener(print_event)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Reployer headless: polling {', '.join(server.name for server in collector.servers)}", flush=True)
+    collector.start()
+    if collector.metrics_server is not None:
+        print(f"Metrics at http://127.0.0.1:{collector.metrics_server.port}/metrics", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.stop()
+        counters = collector.writer.counters()
+        if counters['dropped'] or counters['failed']:
+            print(f"History writer: {counters['dropped']} writes dropped, {counters['failed']} failed (last error: {counters['last_error']})", file=sys.stderr)
+    return 0
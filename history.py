@@ -0,0 +1,273 @@
+import io
+import os
+import time
+import zipfile
+
+import numpy as np
+
+from timeseries import FLAG_QUERY_FAILED, RECORD
+
+# In-memory player count history for the graph, kept at several resolutions so any zoom level
+# is drawn from at most a few thousand points. Failed queries are left out (they only repeat
+# the last known count)
+
+# numpy view of one timeseries RECORD
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<u4'), ('map_id', '<u4'), ('set_id', '<u4'),
+    ('player_count', '<u2'), ('flags', 'u1'), ('pad', 'u1'),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+# Bucket widths in seconds, 0 being the raw samples, and how long each one is kept in memory
+# (None keeps everything)
+RESOLUTIONS = (0, 60, 15 * 60, 3600)
+RETENTION = {0: 2 * 86400, 60: 30 * 86400, 15 * 60: None, 3600: None}
+# query() picks the finest resolution that has no more than this many points in range
+MAX_POINTS = 1500
+INITIAL_CAPACITY = 1024
+# The levels kept forever are cached next to the store, so a start only reads what was logged
+# since the last save plus the retention window of the others, however long the log is
+CACHE_FILE = "graph_cache.npz"
+CACHE_VERSION = 1
+
+
+class Series:
+    # One resolution: bucket start times with min, max, sum and sample count per bucket, in
+    # growable numpy columns. Raw samples are buckets of one
+    COLUMNS = ('start', 'low', 'high', 'total', 'count')
+
+    def __init__(self, width, retention=None):
+        self.width = width
+        self.retention = retention
+        self.size = 0
+        self.start = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.low = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.high = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.total = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.count = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+
+    def reserve(self, extra):
+        needed = self.size + extra
+        capacity = len(self.start)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in self.COLUMNS:
+            column = np.empty(capacity, dtype=getattr(self, name).dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def extend(self, times, counts):
+        # Add samples in time order, anything older than what is already stored is dropped
+        times = np.asarray(times, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+        keys = times if self.width == 0 else times - times % self.width
+        # A clock that jumped back would break the ordering, skip samples until it catches up
+        ordered = keys >= np.maximum.accumulate(keys)
+        if not ordered.all():
+            keys, counts = keys[ordered], counts[ordered]
+        if self.size:
+            last = self.start[self.size - 1]
+            keep = keys > last if self.width == 0 else keys >= last
+            keys, counts = keys[keep], counts[keep]
+        if len(keys) == 0:
+            return
+
+        # One bucket per run of equal keys (keys are sorted)
+        edges = np.flatnonzero(np.diff(keys)) + 1
+        firsts = np.concatenate(([0], edges))
+        starts = keys[firsts]
+        low = np.minimum.reduceat(counts, firsts)
+        high = np.maximum.reduceat(counts, firsts)
+        total = np.add.reduceat(counts, firsts)
+        count = np.diff(np.concatenate((firsts, [len(keys)])))
+
+        if self.size and starts[0] == self.start[self.size - 1]:
+            # The first bucket carries on the last stored one
+            i = self.size - 1
+            self.low[i] = min(self.low[i], low[0])
+            self.high[i] = max(self.high[i], high[0])
+            self.total[i] += total[0]
+            self.count[i] += count[0]
+            starts, low, high, total, count = starts[1:], low[1:], high[1:], total[1:], count[1:]
+
+        n = len(starts)
+        self.reserve(n)
+        end = self.size + n
+        self.start[self.size:end] = starts
+        self.low[self.size:end] = low
+        self.high[self.size:end] = high
+        self.total[self.size:end] = total
+        self.count[self.size:end] = count
+        self.size = end
+        self.trim()
+
+    def trim(self):
+        # Forget buckets past the retention, in large steps so the copy stays amortised
+        if self.retention is None or not self.size:
+            return
+        cut = int(np.searchsorted(self.start[:self.size], self.start[self.size - 1] - self.retention))
+        if cut < max(self.size // 2, INITIAL_CAPACITY):
+            return
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[:self.size - cut] = column[cut:self.size]
+        self.size -= cut
+
+    def arrays(self, end=None, begin=None):
+        # Copies of the columns for the buckets starting in [begin, end)
+        starts = self.start[:self.size]
+        lo = 0 if begin is None else int(np.searchsorted(starts, begin))
+        hi = self.size if end is None else int(np.searchsorted(starts, end))
+        return {name: getattr(self, name)[lo:hi].copy() for name in self.COLUMNS}
+
+    def kept(self):
+        # Columns within the retention, trim() only drops what is past it in large steps
+        if self.retention is None or not self.size:
+            return self.arrays()
+        return self.arrays(begin=self.start[self.size - 1] - self.retention)
+
+    def assign(self, arrays):
+        # Replace the contents with columns from arrays()
+        n = len(arrays['start'])
+        self.size = 0
+        self.reserve(n)
+        for name in self.COLUMNS:
+            getattr(self, name)[:n] = arrays[name]
+        self.size = n
+
+    def bounds(self, start, end):
+        starts = self.start[:self.size]
+        return int(np.searchsorted(starts, start - self.width)), int(np.searchsorted(starts, end))
+
+    def points(self, start, end):
+        # (times, avg, low, high) for buckets overlapping [start, end), times at bucket centres
+        lo, hi = self.bounds(start, end)
+        times = self.start[lo:hi] + self.width / 2
+        average = self.total[lo:hi] / self.count[lo:hi]
+        return times, average, self.low[lo:hi].copy(), self.high[lo:hi].copy()
+
+
+def band_vertices(times, low, high):
+    # Outline of the min/max band as one polygon: along the highs, then back along the lows
+    return np.column_stack((np.concatenate((times, times[::-1])), np.concatenate((high, low[::-1]))))
+
+
+class History:
+    # All resolutions of one player count series, filled from the history store and live samples
+    def __init__(self, resolutions=RESOLUTIONS, retention=RETENTION):
+        self.levels = [Series(width, retention.get(width)) for width in resolutions]
+
+    def add(self, timestamp, player_count, failed=False):
+        if failed:
+            return
+        self.extend([int(timestamp)], [player_count])
+
+    def extend(self, times, counts, levels=None):
+        for level in self.levels if levels is None else levels:
+            level.extend(times, counts)
+
+    def extend_raw(self, chunk, levels=None):
+        # Add a chunk of raw store records
+        records = np.frombuffer(chunk, dtype=RECORD_DTYPE)
+        ok = (records['flags'] & FLAG_QUERY_FAILED) == 0
+        self.extend(records['timestamp'][ok], records['player_count'][ok], levels)
+
+    def latest(self):
+        # Timestamp of the last sample, None when empty
+        raw = self.levels[0]
+        return int(raw.start[raw.size - 1]) if raw.width == 0 and raw.size else None
+
+    def to_bytes(self):
+        # Every level as an npz archive, to hand the history to another process (hub.py)
+        arrays = {'widths': np.array([level.width for level in self.levels])}
+        for level in self.levels:
+            for name, column in level.kept().items():
+                arrays[f"{level.width}_{name}"] = column
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        # A History from to_bytes(), levels the sender does not have are left empty
+        history = cls()
+        with np.load(io.BytesIO(data)) as arrays:
+            widths = set(int(width) for width in arrays['widths'])
+            for level in history.levels:
+                if level.width in widths:
+                    level.assign({name: arrays[f"{level.width}_{name}"] for name in Series.COLUMNS})
+        return history
+
+    def split_levels(self):
+        # (levels with a retention, levels kept forever)
+        return [level for level in self.levels if level.retention is not None], [level for level in self.levels if level.retention is None]
+
+    def load(self, store, now=None):
+        # Fill from a TimeSeriesStore: the levels with a retention from that window only, the
+        # others from the cache written by save() plus the records logged after it
+        now = time.time() if now is None else now
+        fine, coarse = self.split_levels()
+        coarse_from = self.load_cache(store, coarse)
+        # From a bucket boundary, so the first bucket of each level is complete
+        since = min((now - level.retention - (now - level.retention) % (level.width or 1) for level in fine), default=None)
+        fine_from = len(store) if since is None else store.find(since)
+        index = min(coarse_from, fine_from)
+        for chunk in store.read_raw(index):
+            end = index + len(chunk) // RECORD.size
+            for levels, first in ((fine, fine_from), (coarse, coarse_from)):
+                if levels and end > first:
+                    self.extend_raw(chunk[max(first - index, 0) * RECORD.size:], levels)
+            index = end
+
+    def load_cache(self, store, levels):
+        # Restore `levels` from the cache, returns the store index to carry on from (0 when
+        # there is no usable cache)
+        if not levels:
+            return len(store)
+        try:
+            with np.load(os.path.join(store.directory, CACHE_FILE)) as data:
+                if int(data['version']) != CACHE_VERSION or list(data['widths']) != [level.width for level in levels]:
+                    return 0
+                cut, index = int(data['cut']), int(data['index'])
+                columns = [{name: data[f"{level.width}_{name}"] for name in Series.COLUMNS} for level in levels]
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return 0
+        # A store that was rebuilt since (reployer import) no longer lines up with the cache
+        if index > len(store) or store.find(cut) != index:
+            return 0
+        for level, arrays in zip(levels, columns):
+            level.assign(arrays)
+        return index
+
+    def save(self, store):
+        # Cache the levels kept forever, up to the start of the last bucket of the widest one
+        # so every cached bucket is complete. Call with the store flushed
+        _, coarse = self.split_levels()
+        if not any(level.size for level in coarse):
+            return
+        widest = max(level.width for level in coarse)
+        last = max(int(level.start[level.size - 1]) for level in coarse if level.size)
+        cut = last - last % widest
+        arrays = {
+            'version': CACHE_VERSION, 'cut': cut, 'index': store.find(cut),
+            'widths': np.array([level.width for level in coarse]),
+        }
+        for level in coarse:
+            for name, column in level.arrays(cut).items():
+                arrays[f"{level.width}_{name}"] = column
+        path = os.path.join(store.directory, CACHE_FILE)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+
+    def query(self, start, end, max_points=MAX_POINTS):
+        # (bucket width, times, avg, low, high) at the finest resolution that fits max_points and
+        # still holds the whole range
+        for level in self.levels:
+            if level.retention is not None and end - start > level.retention:
+                continue
+            lo, hi = level.bounds(start, end)
+            if hi - lo <= max_points or level is self.levels[-1]:
+                return (level.width,) + level.points(start, end)
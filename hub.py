@@ -0,0 +1,608 @@
+import argparse
+import asyncio
+import itertools
+import json
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from a2s_client import Player, QueryError, ServerInfo
+from collector import MAIN_SERVER, Collector, ServerState, print_event
+from metrics import METRICS_PORT, counter, gauge
+from poller import PollResult, Server
+from roster import RosterEntry, RosterEvent, Session
+from views import View, reconnect_delay
+from writer import DEFAULT_FSYNC, FSYNC_POLICIES
+
+# Local hub: one process owns the poller, the history and the views feed, and any number of
+# GUIs subscribe to it over a WebSocket instead of each querying the server themselves.
+#   python hub.py                              run the hub
+#   python reployer.py --hub [ws://host:port]  start the GUI as a hub subscriber
+#
+# Protocol, JSON text messages unless noted:
+#   client -> hub  {"type": "subscribe", "history": bool}, then {"type": "probe", "id": n} and
+#                  {"type": "players_wanted", "wanted": bool} (player list on screen or not)
+#   hub -> client  "snapshot" with the full state tree, the roster and the server list,
+#                  binary frames of the graph history (when asked, one History.to_bytes()
+#                  archive split in frames), "history_end" with the time of the last sample
+#                  in it and the last few samples (for a client that reconnects),
+#                  then a stream of
+#                    "delta"   {"event": "state"|"poll", "changes": {...}}, changes to the state
+#                              tree (nested dicts are merged, anything else replaced)
+#                    "roster"  join/leave events and the roster rows that changed
+#                    "event"   {"event": name, "args": [...]} for sample, online_changed,
+#                              views, views_status and view_gaps
+#                    "probe_result" {"id": n, "ping": seconds or null, "error": text or null}
+# Every stream message carries a sequence number, so a client never applies a change twice
+
+HUB_HOST = "127.0.0.1"
+HUB_PORT = 9184
+HUB_URL = f"ws://{HUB_HOST}:{HUB_PORT}"
+# Bytes per binary history frame, well under the 1 MiB WebSocket message limit
+HISTORY_FRAME_BYTES = 512 * 1024
+# Samples resent to a reconnecting subscriber, which only takes those newer than its own
+RECENT_SAMPLES = 64
+# Messages queued per subscriber before it is dropped as too slow (it reconnects and resyncs)
+CLIENT_QUEUE = 1000
+# A roster row's duration is sent again only when it drifts this far from what the subscriber
+# can work out from elapsed time
+DURATION_DRIFT = 1.0
+# How long the GUI waits for the hub's history before drawing without it
+HISTORY_TIMEOUT = 30
+
+HUB_CLIENTS = gauge("reployer_hub_subscribers", "GUIs subscribed to the hub")
+HUB_MESSAGES = counter("reployer_hub_messages_total", "Messages published by the hub")
+HUB_DROPPED = counter("reployer_hub_dropped_subscribers_total", "Subscribers dropped for falling behind")
+
+
+def diff(old, new):
+    # Changes turning old into new: nested dicts are diffed key by key, anything else replaced
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or previous != value:
+            changes[key] = value
+    return changes
+
+
+def merge(state, changes):
+    # Apply diff() output in place
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(state.get(key), dict):
+            merge(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+
+def encode_info(info):
+    return info._asdict() if info is not None else None
+
+
+def decode_info(data):
+    return ServerInfo(**data) if data else None
+
+
+def encode_error(error):
+    return (str(error) or type(error).__name__) if error is not None else None
+
+
+def decode_players(names):
+    # Names only, durations come with the roster
+    return [Player(index, name, 0, 0.0) for index, name in enumerate(names)]
+
+
+class Subscriber:
+    def __init__(self, since):
+        self.since = since  # last sequence number included in its snapshot
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE)
+        self.wants_players = False
+
+
+class Hub:
+    # Publishes a collector's events to WebSocket subscribers. Listener calls come from the
+    # collector's threads, state is kept under a lock and messages are handed to the hub's
+    # event loop thread for sending
+    def __init__(self, collector, host=HUB_HOST, port=HUB_PORT):
+        self.collector = collector
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.state = {"server": None, "results": {}, "schedule": {}, "views": {"status": None, "last": None}}
+        self.roster = {}  # key -> [name, duration, time the duration was sent]
+        self.recent_samples = deque(maxlen=RECENT_SAMPLES)
+        # Graph history kept up to date with every sample, sent to new subscribers. Bounded by
+        # the history retention, not by the size of the log
+        self.history = None
+        self.last_sample_time = None
+        self.sequence = 0
+        self.subscribers = set()
+        self.loop = None
+        self.stopped = None
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        # Returns False if the hub could not listen (port in use)
+        self.history = self.collector.load_history(self.lock)
+        self.last_sample_time = self.history.latest()
+        self.collector.add_listener(self.on_event)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self.error is None
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+
+    async def serve(self):
+        import websockets
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        async with websockets.serve(self.handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.ready.set()
+            await self.stopped.wait()
+
+    def stop(self):
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(5)
+
+    def on_event(self, event, *args):
+        # Collector listener (collector threads)
+        with self.lock:
+            message = self.encode_event(event, *args)
+            if message is None:
+                return
+            self.sequence += 1
+            sequence = message["seq"] = self.sequence
+            text = json.dumps(message)
+        HUB_MESSAGES.inc()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.publish, sequence, text)
+
+    def encode_event(self, event, *args):
+        # Update the hub state and build the message for one collector event (under the lock)
+        if event == "state":
+            state = args[0]
+            server = {
+                "info": encode_info(state.info), "player_count": state.player_count,
+                "players": [player.name for player in state.players], "query_ok": state.query_ok,
+                "offline": state.offline, "fail_count": state.fail_count, "failed_seconds": state.failed_seconds,
+                "timestamp": state.timestamp,
+                "ping": state.ping, "avg_ping": state.avg_ping,
+            }
+            schedule = self.collector.schedule
+            new = {"server": server, "schedule": {"restart": schedule.restart_type(state.timestamp) if schedule else None}}
+            return self.delta("state", new)
+        if event == "poll":
+            results = {
+                name: {
+                    "address": list(result.address), "info": encode_info(result.info),
+                    "players": [player.name for player in result.players], "latency": result.latency,
+                    "ping": result.ping, "error": encode_error(result.error), "timestamp": result.timestamp,
+                    "players_fresh": result.players_fresh,
+                }
+                for name, result in args[0].items()
+            }
+            return self.delta("poll", {"results": results})
+        if event == "roster":
+            return self.roster_delta(*args)
+        if event == "sample":
+            self.recent_samples.append(list(args))
+            self.history.add(*args)
+            self.last_sample_time = args[0]
+        elif event == "views":
+            views = [[view.view_id, view.timestamp, view.is_new] for view in args[0]]
+            self.state["views"]["last"] = views[-1]
+            return {"type": "event", "event": "views", "args": [views]}
+        elif event == "views_status":
+            self.state["views"]["status"] = args[0]
+        elif event not in ("online_changed", "view_gaps"):
+            return None
+        return {"type": "event", "event": event, "args": list(args)}
+
+    def delta(self, event, new):
+        changes = diff(self.state, new)
+        merge(self.state, changes)
+        return {"type": "delta", "event": event, "changes": changes}
+
+    def roster_delta(self, events, entries):
+        now = time.time()
+        keys = [entry.key for entry in entries]
+        joined, durations = [], []
+        for entry in entries:
+            row = self.roster.get(entry.key)
+            if row is None:
+                self.roster[entry.key] = [entry.name, entry.duration, now]
+                joined.append([entry.key, entry.name, entry.duration])
+            elif abs(entry.duration - (row[1] + now - row[2])) > DURATION_DRIFT:
+                row[1], row[2] = entry.duration, now
+                durations.append([entry.key, entry.duration])
+        current = set(keys)
+        left = [key for key in self.roster if key not in current]
+        for key in left:
+            del self.roster[key]
+        message = {
+            "type": "roster", "time": now, "joined": joined, "left": left, "durations": durations,
+            "events": [self.encode_roster_event(event) for event in events],
+        }
+        # Rows are kept in join order on both ends, the full order is only sent if that breaks
+        if list(self.roster) != keys:
+            self.roster = {key: self.roster[key] for key in keys}
+            message["order"] = keys
+        return message
+
+    def encode_roster_event(self, event):
+        session = event.session
+        return [event.kind, event.name, event.timestamp, session.key, session.joined, session.last_seen]
+
+    def snapshot(self):
+        # Full state for a new subscriber (under the lock)
+        now = time.time()
+        return {
+            "type": "snapshot", "seq": self.sequence, "time": now, "state": self.state,
+            "roster": [[key, name, duration + now - sent] for key, (name, duration, sent) in self.roster.items()],
+            "servers": [[server.name, server.address[0], server.address[1], server.deadline] for server in self.collector.servers],
+            "main_server": self.collector.main_server,
+        }
+
+    def publish(self, sequence, text):
+        # Queue a message for every subscriber whose snapshot did not already include it (hub loop)
+        for subscriber in list(self.subscribers):
+            if sequence <= subscriber.since:
+                continue
+            try:
+                subscriber.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                # Too slow to keep up, it gets a fresh snapshot when it reconnects
+                HUB_DROPPED.inc()
+                self.subscribers.discard(subscriber)
+                subscriber.queue = None
+
+    async def handler(self, websocket):
+        try:
+            request = json.loads(await asyncio.wait_for(websocket.recv(), timeout=10))
+        except Exception:
+            return
+        with self.lock:
+            # The history as of the snapshot's sequence number, later samples come as events
+            snapshot = json.dumps(self.snapshot())
+            subscriber = Subscriber(self.sequence)
+            end = json.dumps({"type": "history_end", "last": self.last_sample_time, "recent": list(self.recent_samples)})
+            history = self.history.to_bytes() if request.get("history") else b''
+        self.subscribers.add(subscriber)
+        HUB_CLIENTS.set(len(self.subscribers))
+        try:
+            await websocket.send(snapshot)
+            # Each frame waits for the socket to drain before the next one is queued
+            for start in range(0, len(history), HISTORY_FRAME_BYTES):
+                await websocket.send(history[start:start + HISTORY_FRAME_BYTES])
+            # Not held for the life of the connection
+            history = None
+            await websocket.send(end)
+            receiver = asyncio.ensure_future(self.receive(websocket, subscriber))
+            try:
+                while subscriber.queue is not None:
+                    getter = asyncio.ensure_future(subscriber.queue.get())
+                    done, _ = await asyncio.wait((getter, receiver), return_when=asyncio.FIRST_COMPLETED)
+                    if receiver in done:
+                        getter.cancel()
+                        break
+                    await websocket.send(getter.result())
+            finally:
+                receiver.cancel()
+        except Exception:
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            HUB_CLIENTS.set(len(self.subscribers))
+            self.update_players_wanted()
+
+    def update_players_wanted(self):
+        # The hub fetches the player list every poll while any subscriber shows it
+        self.collector.set_players_wanted(any(subscriber.wants_players for subscriber in self.subscribers))
+
+    async def receive(self, websocket, subscriber):
+        # Requests from a subscriber, returns when it disconnects
+        async for message in websocket:
+            try:
+                request = json.loads(message)
+            except ValueError:
+                continue
+            if request.get("type") == "probe":
+                self.probe(websocket, request.get("id"))
+            elif request.get("type") == "players_wanted":
+                subscriber.wants_players = bool(request.get("wanted"))
+                self.update_players_wanted()
+
+    def probe(self, websocket, probe_id):
+        def reply(ping, error):
+            text = json.dumps({"type": "probe_result", "id": probe_id, "ping": ping, "error": encode_error(error)})
+            self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.send_quietly(websocket, text)))
+        self.collector.probe(reply)
+
+    async def send_quietly(self, websocket, text):
+        try:
+            await websocket.send(text)
+        except Exception:
+            pass
+
+
+class RemoteHistory:
+    # The hub's graph history as it arrives, turned into a History by load_history()
+    def __init__(self, timeout=HISTORY_TIMEOUT):
+        self.timeout = timeout
+        self.chunks = []
+        self.done = threading.Event()
+
+    def data(self):
+        self.done.wait(self.timeout)
+        return b''.join(self.chunks)
+
+
+class HubClient:
+    # Stands in for a Collector in the GUI: the same listener events and attributes, fed by a hub
+    # instead of polling. Reconnects with backoff and resyncs from a fresh snapshot
+    def __init__(self, url=HUB_URL):
+        self.url = url
+        self.listeners = []
+        self.servers = []
+        self.main_server = MAIN_SERVER
+        self.server_results = {}
+        self.query_fail_count = 0
+        self.failed_seconds = 0
+        self.metrics_server = None
+        self.schedule_state = {}
+        self.store = RemoteHistory()
+        self.state = {}
+        self.roster = {}  # key -> [name, duration, time]
+        self.sequence = 0
+        # Time of the last sample passed on, samples the hub resends after a reconnect are
+        # only passed on when newer
+        self.last_sample_time = None
+        self.history_requested = False
+        self.probes = {}
+        self.probe_ids = itertools.count(1)
+        self.players_wanted = False
+        self.websocket = None
+        self.loop = None
+        self.running = False
+        self.thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, *args):
+        for listener in list(self.listeners):
+            try:
+                listener(event, *args)
+            except Exception:
+                pass
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.loop is not None and self.websocket is not None:
+            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+
+    def run(self):
+        asyncio.run(self.connect_forever())
+
+    async def connect_forever(self):
+        import websockets
+
+        self.loop = asyncio.get_running_loop()
+        attempt = 0
+        while self.running:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    # The history is asked for until it arrived once, a partial one is dropped
+                    self.history_requested = not self.store.done.is_set()
+                    self.store.chunks.clear()
+                    await websocket.send(json.dumps({"type": "subscribe", "history": self.history_requested}))
+                    self.websocket = websocket
+                    if self.players_wanted:
+                        await websocket.send(json.dumps({"type": "players_wanted", "wanted": True}))
+                    for probe_id in list(self.probes):
+                        await websocket.send(json.dumps({"type": "probe", "id": probe_id}))
+                    async for message in websocket:
+                        attempt = 0
+                        if isinstance(message, bytes):
+                            self.store.chunks.append(message)
+                        else:
+                            self.handle(json.loads(message))
+            except Exception as e:
+                self.emit("views_status", f"Hub unreachable: {str(e) or type(e).__name__}")
+            self.websocket = None
+            if self.running:
+                await asyncio.sleep(reconnect_delay(attempt))
+                attempt += 1
+
+    def handle(self, message):
+        kind = message.get("type")
+        if kind == "snapshot":
+            self.apply_snapshot(message)
+            return
+        if kind == "history_end":
+            if self.history_requested:
+                # Everything up to "last" is in the history just received
+                self.last_sample_time = message.get("last")
+                self.store.done.set()
+            for sample in message.get("recent", []):
+                self.emit_sample(*sample)
+            return
+        if kind == "probe_result":
+            callback = self.probes.pop(message.get("id"), None)
+            if callback is not None:
+                error = message.get("error")
+                callback(message.get("ping"), QueryError(error) if error else None)
+            return
+        sequence = message.get("seq", 0)
+        if sequence <= self.sequence:
+            return
+        self.sequence = sequence
+        if kind == "delta":
+            merge(self.state, message["changes"])
+            if message["event"] == "state":
+                self.emit_state()
+            else:
+                self.emit_poll()
+        elif kind == "roster":
+            self.apply_roster(message)
+        elif kind == "event":
+            args = message["args"]
+            if message["event"] == "views":
+                args = [[View(*view) for view in args[0]]]
+            elif message["event"] == "view_gaps":
+                args = [[tuple(gap) for gap in args[0]]]
+            elif message["event"] == "sample":
+                self.emit_sample(*args)
+                return
+            self.emit(message["event"], *args)
+
+    def emit_sample(self, timestamp, *args):
+        if self.last_sample_time is not None and timestamp <= self.last_sample_time:
+            return
+        self.last_sample_time = timestamp
+        self.emit("sample", timestamp, *args)
+
+    def apply_snapshot(self, message):
+        self.sequence = message["seq"]
+        self.state = message["state"]
+        self.main_server = message["main_server"]
+        self.servers[:] = [Server(name, (host, port), deadline) for name, host, port, deadline in message["servers"]]
+        now = message["time"]
+        self.roster = {key: [name, duration, now] for key, name, duration in message["roster"]}
+        # Bring the GUI up to date at once, as if the last poll had just come in
+        if self.state.get("server"):
+            self.emit_state()
+        self.emit_poll()
+        self.emit("roster", [], self.roster_entries(now))
+        views = self.state.get("views", {})
+        if views.get("status"):
+            self.emit("views_status", views["status"])
+        if views.get("last"):
+            view_id, timestamp, _ = views["last"]
+            self.emit("views", [View(view_id, timestamp, False)])
+
+    def emit_state(self):
+        server = self.state["server"]
+        self.query_fail_count = server["fail_count"]
+        self.failed_seconds = server.get("failed_seconds", 0)
+        self.schedule_state = self.state.get("schedule", {})
+        self.emit("state", ServerState(
+            decode_info(server["info"]), server["player_count"], decode_players(server["players"]),
+            server["query_ok"], server["offline"], server["fail_count"], server["timestamp"],
+            server["ping"], server["avg_ping"], self.failed_seconds,
+        ))
+
+    def emit_poll(self):
+        results = {}
+        for name, result in self.state.get("results", {}).items():
+            error = result["error"]
+            results[name] = PollResult(
+                name, tuple(result["address"]), decode_info(result["info"]), decode_players(result["players"]),
+                result["latency"], result["ping"], QueryError(error) if error else None, result["timestamp"],
+                result.get("players_fresh", True),
+            )
+        self.server_results = results
+        self.emit("poll", results)
+
+    def apply_roster(self, message):
+        now = message["time"]
+        for key in message["left"]:
+            self.roster.pop(key, None)
+        for key, name, duration in message["joined"]:
+            self.roster[key] = [name, duration, now]
+        for key, duration in message["durations"]:
+            if key in self.roster:
+                self.roster[key][1:] = [duration, now]
+        if "order" in message:
+            self.roster = {key: self.roster[key] for key in message["order"] if key in self.roster}
+        events = []
+        for kind, name, timestamp, key, joined, last_seen in message["events"]:
+            events.append(RosterEvent(kind, name, timestamp, Session(key, name, joined, last_seen, last_seen - joined, 0)))
+        self.emit("roster", events, self.roster_entries(now))
+
+    def roster_entries(self, now):
+        return [RosterEntry(key, name, duration + now - sent) for key, (name, duration, sent) in self.roster.items()]
+
+    def load_history(self, lock=None):
+        # The graph history the hub sent, empty if it did not arrive in time
+        from history import History
+        data = self.store.data()
+        if not data:
+            return History()
+        return History.from_bytes(data)
+
+    def set_players_wanted(self, wanted):
+        # Passed on to the hub, which fetches the list every poll while any window shows it
+        self.players_wanted = wanted
+        self.send({"type": "players_wanted", "wanted": wanted})
+
+    def send(self, message):
+        # Send from any thread, dropped while disconnected (state is resent on reconnect)
+        if self.loop is not None and self.websocket is not None:
+            asyncio.run_coroutine_threadsafe(self.websocket.send(json.dumps(message)), self.loop)
+
+    def probe(self, callback, address=None):
+        # Ask the hub to ping the main server, callback(ping, error) once it answers
+        probe_id = next(self.probe_ids)
+        self.probes[probe_id] = callback
+        self.send({"type": "probe", "id": probe_id})
+
+
+def main(argv=None):
+    #   python hub.py
+    #   python hub.py --port 9184 --verbose
+    parser = argparse.ArgumentParser(prog="hub.py", description="Reployer hub: poll once, serve every GUI")
+    parser.add_argument('--host', default=HUB_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=HUB_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=DEFAULT_FSYNC, help="when to fsync the history (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, metavar='PORT', help="serve metrics on 127.0.0.1:PORT, 0 to disable (default: %(default)s)")
+    parser.add_argument('--keep-segments', type=int, metavar='N', help="keep only the newest N archived history segments, about one per day (default: all)")
+    parser.add_argument('--verbose', action='store_true', help="print every event like headless mode")
+    args = parser.parse_args(argv)
+
+    collector = Collector(fsync=args.fsync, metrics_port=args.metrics_port, keep_segments=args.keep_segments)
+    hub = Hub(collector, args.host, args.port)
+    if not hub.start():
+        print(f"Could not listen on {args.host}:{args.port}: {hub.error}", file=sys.stderr)
+        collector.stop()
+        return 1
+    if args.verbose:
+        collector.add_listener(print_event)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Reployer hub on ws://{args.host}:{hub.port}, polling {', '.join(server.name for server in collector.servers)}", flush=True)
+    collector.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.stop()
+        collector.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
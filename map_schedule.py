@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+# The map rotation repeats every len(maps) cycles, cycle 0 starting at midnight UTC
+ROTATION_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "map_rotation.json")
+
+# Restart windows as (start, end) seconds into a cycle, end exclusive
+FIRST_RESTART = (59 * 60 + 10, 60 * 60)
+SECOND_RESTART = (60, 60 + 31)
+
+
+class MapSchedule:
+    # Rotation loaded once, with per-map lookup tables so "when is the next X" is constant time
+    def __init__(self, maps, cycle_seconds=3600):
+        self.maps = tuple(maps)
+        self.cycle_seconds = cycle_seconds
+        self.length = len(self.maps)
+        # cycles_until[map][i]: cycles from slot i to the next slot (strictly after i) playing map
+        self.cycles_until = {}
+        for map_name in set(self.maps):
+            table = []
+            for i in range(self.length):
+                table.append(next(k for k in range(1, self.length + 1) if self.maps[(i + k) % self.length] == map_name))
+            self.cycles_until[map_name] = table
+
+    @staticmethod
+    def to_epoch(when):
+        if when is None:
+            return time.time()
+        if isinstance(when, datetime):
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return when.timestamp()
+        return when
+
+    def cycle_index(self, when=None):
+        # Absolute cycle number since the epoch
+        return int(self.to_epoch(when) // self.cycle_seconds)
+
+    def cycle_start(self, when=None):
+        return self.cycle_index(when) * self.cycle_seconds
+
+    def map_for_cycle(self, cycle):
+        return self.maps[cycle % self.length] if self.length else "unknown"
+
+    def map_at(self, when=None):
+        return self.map_for_cycle(self.cycle_index(when))
+
+    def map_at_hour(self, hour):
+        # Map for a UTC hour of the day (hourly cycles)
+        if not 0 <= hour < self.length:
+            return "unknown"
+        return self.maps[hour]
+
+    def seconds_into_cycle(self, when=None):
+        return self.to_epoch(when) % self.cycle_seconds
+
+    def next_occurrence(self, map_name, when=None):
+        # Start time (epoch) of the next cycle after the current one that plays map_name, or None
+        table = self.cycles_until.get(map_name)
+        if table is None:
+            return None
+        cycle = self.cycle_index(when)
+        return (cycle + table[cycle % self.length]) * self.cycle_seconds
+
+    def upcoming(self, count, when=None):
+        # The next `count` cycles after the current one as (start epoch, map) pairs
+        cycle = self.cycle_index(when)
+        return [
+            ((cycle + k) * self.cycle_seconds, self.map_for_cycle(cycle + k))
+            for k in range(1, count + 1)
+        ]
+
+    def restart_type(self, when=None):
+        # "FIRST", "SECOND" or None depending on the restart window we are in
+        offset = self.seconds_into_cycle(when)
+        if FIRST_RESTART[0] <= offset < FIRST_RESTART[1]:
+            return "FIRST"
+        if SECOND_RESTART[0] <= offset < SECOND_RESTART[1]:
+            return "SECOND"
+        return None
+
+
+def load_schedule(filename=ROTATION_FILENAME):
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return MapSchedule(data['maps'], int(data.get('cycle_seconds', 3600)))
+
+
+def format_utc(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+
+
+def main(argv=None):
+    # Headless forecast for scripts:
+    #   python map_schedule.py --list 12
+    #   python map_schedule.py --next dustbowl --json
+    parser = argparse.ArgumentParser(description="CGE7-193 map rotation forecast")
+    parser.add_argument('--list', type=int, default=6, metavar='N', help="show the next N cycles")
+    parser.add_argument('--next', metavar='MAP', help="show when MAP is next played")
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args(argv)
+
+    schedule = load_schedule()
+    if args.next:
+        start = schedule.next_occurrence(args.next)
+        if start is None:
+            print(f"{args.next} is not in the rotation", file=sys.stderr)
+            return 1
+        if args.json:
+            print(json.dumps({'map': args.next, 'start': start}))
+        else:
+            print(f"Next {args.next}: {format_utc(start)}")
+        return 0
+
+    cycles = schedule.upcoming(args.list)
+    if args.json:
+        print(json.dumps([{'start': start, 'map': map_name} for start, map_name in cycles]))
+    else:
+        for start, map_name in cycles:
+            print(f"{format_utc(start)}  {map_name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process metrics: counters, gauges and latency histograms that any thread can update,
+# served in the Prometheus text format on localhost and summarised for the GUI debug panel.
+# Standard library only, so headless mode can serve them too
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9183
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    # One named metric with a value per combination of label values
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key, value):
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+
+class Gauge(Metric):
+    # Set directly, or read from func() at scrape time
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), func=None):
+        super().__init__(name, help_text, labels)
+        self.func = func
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def render(self):
+        if self.func is not None:
+            try:
+                self.set(self.func())
+            except Exception:
+                ERRORS.inc(where=f"gauge:{self.name}")
+        return super().render()
+
+
+class Histogram(Metric):
+    # Cumulative-bucket histogram; the value per label set is [bucket counts, sum, count]
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS, seconds=True):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.seconds = seconds
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+    def snapshot(self):
+        # {label values: (count, mean, p50, p99)}, quantiles as bucket upper bounds
+        with self.lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        result = {}
+        for key, counts, total, count in items:
+            result[key] = (count, total / count if count else 0.0, self.quantile(counts, count, 0.5), self.quantile(counts, count, 0.99))
+        return result
+
+    def quantile(self, counts, count, q):
+        rank = q * count
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+class Timer:
+    # with HISTOGRAM.time(label=...): records how long the block took
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        # Registering a name again returns the metric already there
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Plain text for the debug panel: counter totals and histogram count/mean/p50/p99
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            if isinstance(metric, Histogram):
+                for key, (count, mean, p50, p99) in sorted(metric.snapshot().items()):
+                    label = f" {'/'.join(key)}" if key else ""
+                    if metric.seconds:
+                        lines.append(f"{metric.name}{label}: n={count} mean={mean * 1000:.1f}ms p50<={p50 * 1000:g}ms p99<={p99 * 1000:g}ms")
+                    else:
+                        lines.append(f"{metric.name}{label}: n={count} mean={mean:.1f} p50<={p50:g} p99<={p99:g}")
+            else:
+                if isinstance(metric, Gauge) and metric.func is not None:
+                    metric.render()
+                with metric.lock:
+                    items = sorted(metric.values.items())
+                for key, value in items:
+                    label = f" {'/'.join(key)}" if key else ""
+                    lines.append(f"{metric.name}{label}: {format_value(value)}")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def gauge(name, help_text, labels=(), func=None):
+    return REGISTRY.register(Gauge(name, help_text, labels, func))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS, seconds=True):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets, seconds))
+
+
+# Exceptions that are caught and skipped so one bad callback does not stop a loop, by place
+ERRORS = counter("reployer_errors_total", "Exceptions caught and skipped", ("where",))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    # Serves the registry at http://host:port/metrics from a daemon thread
+    def __init__(self, port=METRICS_PORT, host=METRICS_HOST):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        # Returns False when the port could not be bound (another instance already serving)
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        except OSError:
+            self.server = None
+            return False
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return True
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
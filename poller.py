@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from a2s_client import ParseError, QueryClient, QueryError
+from metrics import ERRORS, counter, histogram
+
+SERVERS_FILENAME = "servers.json"
+
+# Adaptive polling: back off while the main server is down or restarting, and poll in bursts
+# where map changes are expected
+BURST_INTERVAL = 0.5
+BURST_SECONDS = 20
+BACKOFF_FACTOR = 2
+MAX_BACKOFF = 60
+# A2S_INFO goes out every poll. The player list (the larger, slower response) is only fetched
+# when the info player count changed, when this many seconds have passed since the last one,
+# or on every poll while someone is looking at it (players_wanted)
+PLAYERS_INTERVAL = 30
+
+# A server to watch: display name, (host, port) and how long a full query may take
+Server = namedtuple('Server', ['name', 'address', 'deadline'])
+
+# Outcome of querying one server in one poll cycle. latency covers the whole query, ping is
+# the round trip of the info request alone (None when it failed). players_fresh is False when
+# the player list was not fetched this cycle and players is the last one fetched
+PollResult = namedtuple('PollResult', ['name', 'address', 'info', 'players', 'latency', 'ping', 'error', 'timestamp', 'players_fresh'])
+
+# Last player list fetched from a server, when (monotonic) and the info player count it went with
+PlayersCache = namedtuple('PlayersCache', ['players', 'fetched', 'count'])
+
+A2S_LATENCY = histogram("reployer_a2s_request_seconds", "Round trip of answered A2S requests", ("server", "request"))
+A2S_FAILURES = counter("reployer_a2s_failures_total", "Failed server queries by cause", ("server", "cause"))
+POLL_CYCLE = histogram("reployer_poll_cycle_seconds", "Time to query every server once")
+
+
+def load_servers(default_servers, filename=SERVERS_FILENAME):
+    # Load the server list from servers.json, falling back to the defaults.
+    # Expected format: [{"name": "CGE7-193", "host": "1.2.3.4", "port": 22912, "deadline": 5}, ...]
+    if not os.path.exists(filename):
+        return list(default_servers)
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        default_deadline = default_servers[0].deadline if default_servers else 5
+        servers = [
+            Server(entry['name'], (entry['host'], int(entry['port'])), float(entry.get('deadline', default_deadline)))
+            for entry in entries
+        ]
+        return servers or list(default_servers)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return list(default_servers)
+
+
+async def ping_server(client, address):
+    # One A2S_INFO round trip, returns (info, seconds)
+    started = time.monotonic()
+    info = await client.info(address)
+    return info, time.monotonic() - started
+
+
+def failure_cause(error):
+    # Metric label for why a query failed
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, ParseError):
+        return "parse"
+    if isinstance(error, QueryError):
+        return "protocol"
+    if isinstance(error, OSError):
+        return "network"
+    return "other"
+
+
+class AdaptiveInterval:
+    # Picks the delay to the next poll from the last results. `schedule` is a MapSchedule, its
+    # restart windows and cycle boundaries tell when the server is expected to be down or to
+    # switch maps:
+    #   - burst polling from each cycle boundary, from the end of the second restart and after
+    #     a map change was seen, for BURST_SECONDS
+    #   - exponential backoff while the main server does not answer or is in a restart window,
+    #     cut short so no burst start is missed
+    #   - the regular interval otherwise
+    def __init__(self, schedule, main_server, interval=5, burst_starts=(0,)):
+        self.schedule = schedule
+        self.main_server = main_server
+        self.interval = interval
+        self.burst_starts = tuple(burst_starts)
+        self.backoff = 0
+        self.burst_until = 0
+        self.last_map = None
+
+    def __call__(self, results, now=None):
+        now = time.time() if now is None else now
+        main = results.get(self.main_server)
+        info = main.info if main is not None else None
+        if info is not None:
+            if self.last_map is not None and info.map_name != self.last_map:
+                self.burst_until = now + BURST_SECONDS
+            self.last_map = info.map_name
+
+        offset = self.schedule.seconds_into_cycle(now)
+        if now < self.burst_until or any(0 <= offset - start < BURST_SECONDS for start in self.burst_starts):
+            self.backoff = 0
+            return BURST_INTERVAL
+
+        if info is None or self.schedule.restart_type(now) is not None:
+            delay = min(self.interval * BACKOFF_FACTOR ** self.backoff, MAX_BACKOFF)
+            self.backoff += 1
+        else:
+            delay = self.interval
+            self.backoff = 0
+        until_burst = min((start - offset) % self.schedule.cycle_seconds for start in self.burst_starts)
+        return max(min(delay, until_burst), BURST_INTERVAL)
+
+
+class ServerPoller:
+    # Polls every configured server concurrently from its own asyncio thread, on a fixed sample
+    # rate or at the delay returned by scheduler(results, now) after each cycle
+    def __init__(self, servers, callback, interval=5, timeout=5, scheduler=None):
+        self.servers = list(servers)
+        self.callback = callback
+        self.interval = interval
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.players_wanted = False
+        self.players_cache = {}  # server name -> PlayersCache
+        self.running = False
+        self.loop = None
+        self.client = None
+        self.ready = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # Start polling thread
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        asyncio.run(self.poll_forever())
+
+    def submit(self, coro_fn, *args):
+        # Run a coroutine using the shared query client on the poller loop, from any thread.
+        # Returns a concurrent.futures.Future
+        self.ready.wait()
+        return asyncio.run_coroutine_threadsafe(coro_fn(self.client, *args), self.loop)
+
+    async def poll_forever(self):
+        # Own the loop and the query client for as long as polling runs
+        self.loop = asyncio.get_running_loop()
+        self.client = QueryClient(timeout=self.timeout)
+        self.ready.set()
+        try:
+            await self.poll_schedule()
+        finally:
+            self.client.close()
+
+    async def poll_schedule(self):
+        # Keep a steady sample rate: the next cycle is scheduled from when the last one started,
+        # so a slow server never pushes the whole schedule back
+        next_poll = time.monotonic()
+        while self.running:
+            results = await self.poll_once()
+            if not self.running:
+                break
+            try:
+                self.callback(results)
+            except Exception:
+                ERRORS.inc(where="poll_callback")
+            interval = self.interval
+            if self.scheduler is not None:
+                try:
+                    interval = self.scheduler(results, time.time())
+                except Exception:
+                    ERRORS.inc(where="poll_scheduler")
+            next_poll += interval
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                # Fell behind, skip the missed slots instead of bursting to catch up
+                next_poll = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def poll_once(self):
+        # Query all servers at once
+        with POLL_CYCLE.time():
+            results = await asyncio.gather(*(self.query_server(server) for server in self.servers))
+        return {result.name: result for result in results}
+
+    async def query_server(self, server):
+        # Query info, and the player list when it is due, bounded by the server's deadline
+        started = time.monotonic()
+        cached = self.players_cache.get(server.name)
+        due = self.players_wanted or cached is None or started - cached.fetched >= PLAYERS_INTERVAL
+        try:
+            info, ping, players = await asyncio.wait_for(self.fetch(server, due, cached), timeout=server.deadline)
+            error = None
+            players_fresh = players is not None
+            if players_fresh:
+                self.players_cache[server.name] = PlayersCache(players, time.monotonic(), info.player_count)
+            else:
+                players = cached.players
+        except Exception as e:
+            info, ping, players, error, players_fresh = None, None, [], e, False
+            A2S_FAILURES.inc(server=server.name, cause=failure_cause(e))
+        return PollResult(server.name, server.address, info, players, time.monotonic() - started, ping, error, time.time(), players_fresh)
+
+    async def fetch(self, server, due, cached):
+        # Returns (info, ping, players), players None when they were not fetched. A due player
+        # list is requested alongside the info, otherwise only if the player count moved
+        info_task = asyncio.ensure_future(self.timed(server, "info", ping_server(self.client, server.address)))
+        players_task = asyncio.ensure_future(self.timed(server, "players", self.client.players(server.address))) if due else None
+        try:
+            info, ping = await info_task
+            if players_task is None and info.player_count != cached.count:
+                players_task = asyncio.ensure_future(self.timed(server, "players", self.client.players(server.address)))
+            players = await players_task if players_task is not None else None
+        except BaseException:
+            info_task.cancel()
+            if players_task is not None:
+                players_task.cancel()
+            raise
+        return info, ping, players
+
+    async def timed(self, server, request, coro):
+        # Await one request, recording its latency when it is answered
+        started = time.monotonic()
+        result = await coro
+        A2S_LATENCY.observe(time.monotonic() - started, server=server.name, request=request)
+        return result
@@ -1,114 +1,159 @@
-import socket
+import sys
+
+# Command line modes, dispatched before any GUI module gets imported
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # Collectors only
+    from collector import run_headless
+    sys.exit(run_headless(sys.argv[1:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["stats"]:
+    from stats import main
+    sys.exit(main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["import"]:
+    from backfill import main
+    sys.exit(main(sys.argv[2:]))
+
 import tkinter as tk
 from tkinter import ttk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from collections import deque
 import time
 import threading
-import csv
 from datetime import datetime, timezone
 import os
+import random
 import subprocess
-import websockets
-import asyncio
-import json
 import webbrowser
+from collector import CGE7_193, SOURCETV, HISTORY_DIR, MAIN_SERVER, OFFLINE_LABEL_AFTER, Collector
+from map_schedule import load_schedule
+from metrics import ERRORS, REGISTRY, histogram
+from soundbank import SoundBank
+from ticker import SecondTicker, TimedEvents
+from uiqueue import UIUpdateQueue
 
 # Constants
-# CGE7_193 = ('79.127.217.197', 22912) # old server ip
-CGE7_193 = ('169.150.249.133', 22912) # new server IP since 14/08/25
-TIMEOUT = 5
-CSV_FILENAME = "player_log.csv"
+RESOURCE_DIR = "resources"
 ORDINANCE_START = datetime(2025, 4, 25, 0, 0, 0, tzinfo=timezone.utc)
-MAX_DATA_POINTS = 60
-UPDATE_INTERVAL = 5
-VIEWS_WEBSOCKET_URL = "wss://view.gaq9.com"
-
-# Sound and server query modules
-try:
-    import pygame
-    pygame.mixer.init()
-    PYGAME_AVAILABLE = True
-except ImportError:
-    PYGAME_AVAILABLE = False
-
-try:
-    from a2s.info import info as a2s_info
-    from a2s.players import players as a2s_players
-    A2S_AVAILABLE = True
-except ImportError:
-    A2S_AVAILABLE = False
+# Graph range choices in seconds, each drawn from the history resolution that fits it
+GRAPH_RANGES = {
+    "Last 5 minutes": 5 * 60,
+    "Last hour": 3600,
+    "Last 6 hours": 6 * 3600,
+    "Last 24 hours": 24 * 3600,
+    "Last 7 days": 7 * 86400,
+    "Last 30 days": 30 * 86400,
+}
+DEFAULT_GRAPH_RANGE = "Last 5 minutes"
+# Fraction of the range left empty on the right, the axis is re-anchored when it fills up
+GRAPH_HEADROOM = 0.1
+# Lines with more points than this are drawn without markers
+MAX_MARKED_POINTS = 60
+UI_FRAME_MS = 50
+# Maps shown in the "next occurrence" forecast line
+FORECAST_MAPS = ["dustbowl", "askask"]
+# The splash closes as soon as startup finishes, or after this long at most
+SPLASH_MAX_SECONDS = 5
+PREOPEN_SOUNDS = ["preopen1.mp3", "preopen2.mp3", "preopen3.mp3"]
+# Debug panel refresh period
+METRICS_REFRESH_MS = 1000
+
+GRAPH_REDRAW = histogram("reployer_graph_redraw_seconds", "Graph redraw time on the Tk thread", ("kind",))
 
 # Main application class
 class ServerMonitorApp:
     def play_hover_sound(self, event=None):
-        if not PYGAME_AVAILABLE:
-            return
-        try:
-            sound_path = os.path.join("resources", "hover.wav")
-            if os.path.exists(sound_path):
-                sound = pygame.mixer.Sound(sound_path)
-                sound.set_volume(0.25)
-                sound.play()
-        except Exception:
-            pass
-    def get_server_info(self):
-        # Query server info
-        if not A2S_AVAILABLE:
-            return None, 0, []
-        try:
-            info = a2s_info(CGE7_193, timeout=TIMEOUT)
-            players = a2s_players(CGE7_193, timeout=TIMEOUT)
-            return info, len(players), players
-        except Exception:
-            return None, 0, []
+        self.sounds.play("hover.wav")
 
     def start_monitoring(self):
-        # Start server monitoring thread
-        self.update_thread = threading.Thread(target=self.update_loop, daemon=True)
-        self.update_thread.start()
-
-    def __init__(self, root):
+        # Start the collectors (server polling, logging and the views feed)
+        self.collector.add_listener(self.on_collector_event)
+        self.collector.start()
+
+    def on_collector_event(self, event, *args):
+        # Collector events arrive on background threads, widgets are only touched through the UI queue
+        if event == "state":
+            self.update_server_info(*args)
+        elif event == "sample":
+            self.add_graph_sample(*args)
+        elif event == "roster":
+            self.ui.post("player_list", self.update_player_list, args[1])
+        elif event == "poll":
+            self.ui.post("mirrors", self.update_mirrors_display)
+        elif event == "online_changed":
+            self.play_sound("offline.wav" if args[0] else "online.wav")
+        elif event == "views_status":
+            self.ui.post("views_status", self.update_views_status, args[0])
+        elif event == "views":
+            self.on_views(args[0])
+
+    def __init__(self, root, sounds=None, hub_url=None):
         self.root = root
         self.root.title("Reployer v2.6 - Made by Kiverix 'the clown'")
         self.root.geometry("1500x1000")
 
+        # Decode all sounds in the background while the window is built
+        if sounds is None:
+            sounds = SoundBank(RESOURCE_DIR)
+            sounds.preload()
+        self.sounds = sounds
+        self.ui = UIUpdateQueue(self.root, UI_FRAME_MS)
+        self.ui.start()
+        # Set once the first poll answered and the history is on the graph, see is_ready()
+        self.first_poll_done = threading.Event()
+        self.history_loaded = threading.Event()
+
         self.create_custom_title_bar()  # Custom title bar
 
         # Data structures
-        self.timestamps = deque(maxlen=MAX_DATA_POINTS)
-        self.player_counts = deque(maxlen=MAX_DATA_POINTS)
-        self.player_list = []
-        self.server_info = None
+        self.history = None  # history.History once loaded
+        self.graph_pending = []
+        self.graph_window = GRAPH_RANGES[DEFAULT_GRAPH_RANGE]
+        self.graph_lock = threading.Lock()
         self.current_map = None
+        # Polling, logging and the views feed live in the collector, or in a hub shared with
+        # other instances when hub_url is given
+        if hub_url:
+            from hub import HubClient
+            self.collector = HubClient(hub_url)
+        else:
+            self.collector = Collector(history_dir=HISTORY_DIR)
+        self.servers = self.collector.servers
 
         # Map cycle variables
+        self.schedule = load_schedule()
         self.last_map_name = None
         self.map_sound_played = {}
-        self.sound_played_minute = None
-        self.last_time_sound_minute = None
-
-        # Views monitoring
-        self.current_views = 0
-        self.last_view_id = None
-        self.websocket_running = True
+        self.restart_type = None
 
         self.setup_theme()  # Theme
-        self.init_csv()     # CSV file
-        self.load_existing_data()  # Load data
         self.create_widgets()      # GUI widgets
 
-        # Start background tasks
+        # Start background tasks: matplotlib and the history are loaded off the Tk thread
+        # while the first poll is in flight
         self.running = True
+        threading.Thread(target=self.import_graph_modules, daemon=True).start()
+        threading.Thread(target=self.load_existing_data, daemon=True).start()
         self.start_monitoring()
-        self.start_websocket_monitor()
         self.test_connection()
+        self.start_clock()
+
+    def is_ready(self):
+        # True once the window has something to show: sounds, graph, history and the first poll
+        return (
+            self.sounds.loaded.is_set() and self.canvas is not None
+            and self.history_loaded.is_set() and self.first_poll_done.is_set()
+        )
+
+    def show(self):
+        # Bring up the main window once the splash is gone
+        center_window(self.root, 1500, 1000)
+        self.root.deiconify()
         self.play_sound("open.wav")
-        self.update_map_display()
+        # The player list is fetched every poll only while the window is on screen
+        self.root.bind("<Map>", self.on_window_visibility, add="+")
+        self.root.bind("<Unmap>", self.on_window_visibility, add="+")
+        self.collector.set_players_wanted(True)
 
-        # Query failure tracking
-        self.query_fail_count = 0
+    def on_window_visibility(self, event):
+        if event.widget is self.root:
+            self.collector.set_players_wanted(event.type == tk.EventType.Map)
 
     def create_custom_title_bar(self):
         # Custom title bar with close and minimize buttons
@@ -238,6 +283,46 @@ class ServerMonitorApp:
             self.play_sound("information.wav")
         self.youtube_label.bind("<Button-1>", open_youtube)
 
+        self.metrics_label = tk.Label(debug_frame, text="Metrics (F12)", fg="gray", bg=self.theme['bg'], font=("Arial", 9), cursor="hand2")
+        self.metrics_label.pack(side=tk.LEFT, padx=(10, 0))
+        self.metrics_label.bind("<Button-1>", self.toggle_metrics_panel)
+        self.root.bind("<F12>", self.toggle_metrics_panel)
+        self.metrics_window = None
+        self.metrics_refresh_id = None
+
+    def toggle_metrics_panel(self, event=None):
+        # Debug panel with the same numbers as the metrics endpoint, refreshed every second
+        if self.metrics_window is not None:
+            self.metrics_window.destroy()
+            self.metrics_window = None
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Reployer metrics")
+        window.configure(bg=self.theme['bg'])
+        window.protocol("WM_DELETE_WINDOW", self.toggle_metrics_panel)
+        # However the window goes away, its refresh loop goes with it
+        window.bind("<Destroy>", lambda event: self.cancel_metrics_refresh() if event.widget is window else None)
+        server = self.collector.metrics_server
+        endpoint = f"http://127.0.0.1:{server.port}/metrics" if server is not None else "endpoint disabled"
+        tk.Label(window, text=endpoint, fg="#4fc3f7", bg=self.theme['bg'], font=("Arial", 9)).pack(anchor=tk.W, padx=5, pady=(5, 0))
+        self.metrics_text = tk.Text(window, width=110, height=30, font=("Courier", 9), bg=self.theme['bg'], fg=self.theme['fg'])
+        self.metrics_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.metrics_window = window
+        self.refresh_metrics_panel()
+
+    def refresh_metrics_panel(self):
+        self.metrics_refresh_id = None
+        if self.metrics_window is None or not self.running:
+            return
+        self.metrics_text.delete("1.0", tk.END)
+        self.metrics_text.insert(tk.END, REGISTRY.summary())
+        self.metrics_refresh_id = self.root.after(METRICS_REFRESH_MS, self.refresh_metrics_panel)
+
+    def cancel_metrics_refresh(self):
+        if self.metrics_refresh_id is not None:
+            self.root.after_cancel(self.metrics_refresh_id)
+            self.metrics_refresh_id = None
+
     def create_views_frame(self, parent):
         # Views counter frame
         views_frame = ttk.LabelFrame(parent, text="CGE7-193 Diet View Monitor (no new views since July 24th sadly, it's joever)", padding=10)
@@ -275,6 +360,9 @@ class ServerMonitorApp:
         
         self.player_count_label = ttk.Label(info_frame, text="Players: ?/?")
         self.player_count_label.pack(anchor=tk.W)
+
+        self.ping_label = ttk.Label(info_frame, text="Ping: -- ms")
+        self.ping_label.pack(anchor=tk.W)
         
         ttk.Separator(info_frame, orient='horizontal').pack(fill=tk.X, pady=5)
         
@@ -298,6 +386,13 @@ class ServerMonitorApp:
             font=("Arial", 9, "bold")
         )
         self.countdown_label.pack(anchor=tk.W)
+
+        self.forecast_label = ttk.Label(
+            info_frame,
+            text="Next dustbowl: --:-- UTC",
+            font=("Arial", 9)
+        )
+        self.forecast_label.pack(anchor=tk.W)
         
         self.time_label = ttk.Label(
             info_frame,
@@ -314,26 +409,24 @@ class ServerMonitorApp:
         )
         self.restart_status_label.pack(anchor=tk.W)
 
+        self.mirrors_label = ttk.Label(
+            info_frame,
+            text="Mirrors: Waiting for first poll...",
+            font=("Arial", 9)
+        )
+        self.mirrors_label.pack(anchor=tk.W)
+
     def get_map_based_on_utc_hour(self, hour=None):
         # Map schedule by UTC hour
         if hour is None:
             hour = datetime.utcnow().hour
-
-        map_schedule = {
-            0: "askask", 1: "ask", 2: "ask", 3: "askask",
-            4: "ask", 5: "dustbowl", 6: "askask", 7: "ask",
-            8: "ask", 9: "askask", 10: "ask", 11: "dustbowl",
-            12: "askask", 13: "ask", 14: "ask", 15: "askask",
-            16: "ask", 17: "dustbowl", 18: "askask", 19: "ask",
-            20: "dustbowl", 21: "askask", 22: "ask", 23: "dustbowl"
-        }
-        return map_schedule.get(hour, "unknown")
+        return self.schedule.map_at_hour(hour)
     
-    def get_adjacent_maps(self):
+    def get_adjacent_maps(self, utc_now=None):
         # Previous and next map
-        current_hour = datetime.utcnow().hour
-        current_minute = datetime.utcnow().minute
-        current_second = datetime.utcnow().second
+        if utc_now is None:
+            utc_now = datetime.utcnow()
+        current_hour = utc_now.hour
         
         prev_hour = current_hour - 1 if current_hour > 0 else 23
         prev_map = self.get_map_based_on_utc_hour(prev_hour)
@@ -341,87 +434,74 @@ class ServerMonitorApp:
         next_hour = current_hour + 1 if current_hour < 23 else 0
         next_map = self.get_map_based_on_utc_hour(next_hour)
         
-        seconds_remaining = (59 - current_second) % 60
-        minutes_remaining = (59 - current_minute) % 60
+        seconds_remaining = (59 - utc_now.second) % 60
+        minutes_remaining = (59 - utc_now.minute) % 60
         
         return prev_map, next_map, minutes_remaining, seconds_remaining
 
-
-    def update_map_display(self):
-        # Update map and time display
-        utc_now = datetime.utcnow()
+    def start_clock(self):
+        # The clock ticks on second boundaries, everything tied to a mm:ss mark is a timed event
+        self.timed_events = TimedEvents()
+        for minute, second, callback in (
+            (30, 0, lambda: self.play_sound('thirty.wav')),
+            (45, 0, lambda: self.play_sound('fifteen.wav')),
+            (55, 0, lambda: self.play_sound('five.wav')),
+            (59, 0, lambda: self.play_sound('new_cycle.wav')),
+            (59, 10, lambda: self.set_restart_type("FIRST")),
+            (0, 0, lambda: self.set_restart_type(None)),
+            (0, 0, self.update_map_cycle_display),
+            (1, 0, lambda: self.set_restart_type("SECOND")),
+            (1, 31, lambda: self.set_restart_type(None)),
+        ):
+            self.timed_events.add_hourly(minute, second, callback)
+
+        utc_now = datetime.now(timezone.utc)
+        self.set_restart_type(self.schedule.restart_type(utc_now))
+        self.update_map_cycle_display()
+        self.clock = SecondTicker(self.root, self.on_clock_tick)
+        self.clock.start()
+
+    def on_clock_tick(self, utc_now):
+        # Once per second: clocks, countdown and any events that came due
         local_now = datetime.now()
-
-        utc_time = utc_now.strftime("%H:%M:%S")
-        local_time = local_now.strftime("%H:%M:%S")
-
-        current_map = self.get_map_based_on_utc_hour()
-        prev_map, next_map, mins_left, secs_left = self.get_adjacent_maps()
-
-        # Determine restart status
-        current_minute = utc_now.minute
-        current_second = utc_now.second
-
-        restart_type = None
-        if current_minute == 59 and current_second >= 10:
-            restart_status = "FIRST RESTART"
-            status_color = self.theme['status_restart1']
-            restart_type = "FIRST"
-        elif current_minute == 1 and current_second <= 30:
-            restart_status = "SECOND RESTART"
-            status_color = self.theme['status_restart2']
-            restart_type = "SECOND"
-        else:
-            restart_status = "ONLINE"
-            status_color = self.theme['status_online']
-            restart_type = None
-
-        # Play information.wav only once per restart type
-        if not hasattr(self, '_last_restart_type'):
-            self._last_restart_type = None
-        if restart_type and self._last_restart_type != restart_type:
+        self.ui.config(self.time_label, text=f"UTC: {utc_now.strftime('%H:%M:%S')} | Local: {local_now.strftime('%H:%M:%S')}")
+        _, _, mins_left, secs_left = self.get_adjacent_maps(utc_now)
+        self.ui.config(self.countdown_label, text=f"Next cycle in: {mins_left:02d}m {secs_left:02d}s")
+        self.update_ordinance_time(utc_now)
+        self.timed_events.run_due(utc_now.timestamp())
+        self.update_restart_status()
+
+    def update_map_cycle_display(self):
+        # Current, previous and next map only change on the hour
+        utc_now = datetime.now(timezone.utc)
+        current_map = self.get_map_based_on_utc_hour(utc_now.hour)
+        prev_map, next_map, _, _ = self.get_adjacent_maps(utc_now)
+        self.ui.config(self.current_map_cycle_label, text=f"Current Map Cycle: {current_map}")
+        self.ui.config(self.adjacent_maps_label, text=f"Previous: {prev_map} | Next: {next_map}")
+        forecast = []
+        for map_name in FORECAST_MAPS:
+            start = self.schedule.next_occurrence(map_name, utc_now)
+            if start is not None:
+                forecast.append(f"Next {map_name}: {datetime.fromtimestamp(start, timezone.utc).strftime('%H:%M')} UTC")
+        self.ui.config(self.forecast_label, text=" | ".join(forecast) if forecast else "Next cycles: unknown")
+
+    def set_restart_type(self, restart_type):
+        # Play information.wav once when a restart window starts
+        if restart_type and self.restart_type != restart_type:
             self.play_sound("information.wav")
-            self._last_restart_type = restart_type
-        elif restart_type is None:
-            self._last_restart_type = None
-
-        # Update labels
-        self.time_label.config(text=f"UTC: {utc_time} | Local: {local_time}")
-        self.current_map_cycle_label.config(text=f"Current Map Cycle: {current_map}")
-        self.adjacent_maps_label.config(text=f"Previous: {prev_map} | Next: {next_map}")
-        self.countdown_label.config(text=f"Next cycle in: {mins_left:02d}m {secs_left:02d}s")
+        self.restart_type = restart_type
+        self.update_restart_status()
 
+    def update_restart_status(self):
         # If offline, always override status label
-        if hasattr(self, 'query_fail_count') and self.query_fail_count >= 15:
-            self.restart_status_label.config(text="Server Status: OFFLINE", foreground="red")
+        if self.collector.failed_seconds >= OFFLINE_LABEL_AFTER:
+            self.ui.config(self.restart_status_label, text="Server Status: OFFLINE", foreground="red")
+        elif self.restart_type == "FIRST":
+            self.ui.config(self.restart_status_label, text="Server Status: FIRST RESTART", foreground=self.theme['status_restart1'])
+        elif self.restart_type == "SECOND":
+            self.ui.config(self.restart_status_label, text="Server Status: SECOND RESTART", foreground=self.theme['status_restart2'])
         else:
-            self.restart_status_label.config(text=f"Server Status: {restart_status}", foreground=status_color)
-
-        # Play sounds
-        self.handle_time_warning_sounds(utc_now)
-
-        if utc_now.minute == 59 and utc_now.second == 0:
-            if self.sound_played_minute != utc_now.hour:
-                self.play_sound('new_cycle.wav')
-                self.sound_played_minute = utc_now.hour
-        elif utc_now.minute != 59:
-            self.sound_played_minute = None
-
-        self.root.after(50, self.update_map_display)
-
-    def handle_time_warning_sounds(self, utc_now):
-        # Play warning sounds at specific times
-        current_minute = utc_now.minute
-        current_second = utc_now.second
-        
-        if current_second == 0:
-            minute_sounds = {30: 'thirty.wav', 45: 'fifteen.wav', 55: 'five.wav'}
-            sound_key = minute_sounds.get(current_minute)
-            if sound_key and self.last_time_sound_minute != current_minute:
-                self.play_sound(sound_key)
-                self.last_time_sound_minute = current_minute
-            elif current_minute not in minute_sounds:
-                self.last_time_sound_minute = None
+            self.ui.config(self.restart_status_label, text="Server Status: ONLINE", foreground=self.theme['status_online'])
 
     def create_player_list_frame(self, parent):
         # Player list frame
@@ -436,18 +516,71 @@ class ServerMonitorApp:
             selectforeground=self.theme['select_fg']
         )
         self.player_listbox.pack(fill=tk.BOTH, expand=True)
+        self.player_rows = []  # (session key, text) per listbox row
 
     def create_graph_frame(self, parent):
         # Player count graph
         graph_frame = ttk.LabelFrame(parent, text="Player Count History", padding=10)
         graph_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        
+
+        self.graph_range_var = tk.StringVar(value=DEFAULT_GRAPH_RANGE)
+        range_box = ttk.Combobox(
+            graph_frame, textvariable=self.graph_range_var,
+            values=list(GRAPH_RANGES), state="readonly", width=16
+        )
+        range_box.pack(anchor=tk.E)
+        range_box.bind("<<ComboboxSelected>>", self.set_graph_range)
+        self.graph_frame = graph_frame
+        # The figure is added by create_graph_canvas once matplotlib has been imported
+        self.canvas = None
+
+    def import_graph_modules(self):
+        # matplotlib is the slowest import of the app, pull it in on a background thread
+        try:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from matplotlib.figure import Figure
+        except Exception:
+            ERRORS.inc(where="graph_import")
+            return
+        self.ui.post("graph_canvas", self.create_graph_canvas, Figure, FigureCanvasTkAgg)
+
+    def create_graph_canvas(self, Figure, FigureCanvasTkAgg):
+        # Build the figure (main thread)
         self.fig = Figure(figsize=(8, 4), dpi=100)
+        self.fig.subplots_adjust(bottom=0.18)
         self.ax = self.fig.add_subplot(111)
-        self.update_graph_theme()
+
+        # The line and the min/max band are the only artists that change between samples,
+        # everything else is drawn once into a cached background and blitted underneath them
+        self.plot_line, = self.ax.plot([], [], color=self.theme['plot'], marker='o', animated=True)
+        self.graph_band = self.ax.fill_between([], [], [], color=self.theme['plot'], alpha=0.25, linewidth=0, animated=True)
+        self.graph_background = None
+        self.setup_graph_axes()
         
-        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect('draw_event', self.on_graph_draw)
+        self.update_graph()
+
+    def setup_graph_axes(self):
+        # Static graph elements: always show y-axis from 0 to 16 with 17 integer ticks, UTC time on x
+        from matplotlib import dates as mdates
+        self.ax.set_ylim(0, 16)
+        self.ax.set_yticks(list(range(17)))
+        self.ax.yaxis.set_major_formatter(lambda x, pos: f"{int(x)}")
+        locator = mdates.AutoDateLocator(tz=timezone.utc)
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=timezone.utc))
+        self.ax.set_title(f'Online Players - {CGE7_193[0]}:{CGE7_193[1]}', color=self.theme['graph_fg'])
+        self.set_graph_view(self.graph_window, time.time())
+        self.update_graph_theme()
+
+    def set_graph_view(self, window, now):
+        # Show the last `window` seconds with some room on the right for new samples.
+        # x values are days since the epoch, matplotlib's date unit
+        self.graph_view = window
+        self.graph_right = now + window * GRAPH_HEADROOM
+        self.ax.set_xlim((now - window) / 86400.0, self.graph_right / 86400.0)
 
     def update_graph_theme(self):
         # Update graph colors
@@ -485,12 +618,12 @@ class ServerMonitorApp:
     def connect_to_cge(self):
         # Connect to CGE7-193 server
         self.play_sound("join.wav")
-        self.launch_tf2_with_connect("connect 169.150.249.133:22912")
+        self.launch_tf2_with_connect(f"connect {CGE7_193[0]}:{CGE7_193[1]}")
 
     def connect_to_sourceTV(self):
         # Connect to SourceTV server
         self.play_sound("join.wav")
-        self.launch_tf2_with_connect("connect 169.150.249.133:22913")
+        self.launch_tf2_with_connect(f"connect {SOURCETV[0]}:{SOURCETV[1]}")
 
     def show_tf2_not_installed(self):
         # Show splash window if TF2 is not installed
@@ -557,218 +690,216 @@ class ServerMonitorApp:
         )
         ordinance_bar.pack(fill=tk.X, padx=10, pady=(0, 5))
 
-    def init_csv(self):
-        # Initialize CSV file
-        if not os.path.exists(CSV_FILENAME):
-            with open(CSV_FILENAME, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['UTC Timestamp', 'Player Count', 'Map', 'Players Online'])
-
-    def log_to_csv(self, timestamp, player_count, map_name, players):
-        # Log data to CSV
-        try:
-            with open(CSV_FILENAME, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                player_names = ", ".join([player.name for player in players]) if players else "None"
-                writer.writerow([timestamp, player_count, map_name, player_names])
-        except IOError:
-            pass
-
     def load_existing_data(self):
-        # Load existing data from CSV
-        if not os.path.exists(CSV_FILENAME):
-            return
-        
+        # Build the graph history at every resolution, from the cached long-term levels and the
+        # recent part of the store. Runs on a background thread, samples polled meanwhile are
+        # added once it is done
         try:
-            with open(CSV_FILENAME, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                rows = list(reader)
-                
-                for row in rows[-MAX_DATA_POINTS:]:
-                    try:
-                        dt = datetime.fromisoformat(row['UTC Timestamp'].replace('Z', '+00:00'))
-                        time_str = dt.strftime('%H:%M:%S')
-                        player_count = int(row['Player Count'])
-                        
-                        self.timestamps.append(time_str)
-                        self.player_counts.append(player_count)
-                    except (KeyError, ValueError):
-                        continue
-        except Exception:
-            pass
+            history = self.collector.load_history(self.graph_lock)
+        except (OSError, ValueError):
+            from history import History
+            history = History()
+        with self.graph_lock:
+            for sample in self.graph_pending:
+                history.add(*sample)
+            self.graph_pending = []
+            self.history = history
+        self.history_loaded.set()
+        self.update_graph()
+
+    def set_graph_range(self, event=None):
+        # Show the selected time range, the history already holds every resolution
+        self.graph_window = GRAPH_RANGES.get(self.graph_range_var.get(), GRAPH_RANGES[DEFAULT_GRAPH_RANGE])
+        self.update_graph()
 
     def test_connection(self):
-        # Test server connection
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.settimeout(TIMEOUT)
-                sock.connect(CGE7_193)
-                sock.send(b'\xFF\xFF\xFF\xFFTSource Engine Query\x00')
-                sock.recv(1400)
-            self.status_var.set("Connection test successful")
-            return True
-        except Exception as e:
-            self.status_var.set(f"Connection failed: {str(e)}")
-            return False
-
-    def update_server_info(self):
-        # Update server info
-        info, player_count, players = self.get_server_info()
-
-        # Track online/offline state for sound feedback
-        if not hasattr(self, '_last_online_state'):
-            # None means unknown, True means offline, False means online
-            self._last_online_state = None
-
-        if info is None:
-            self.query_fail_count += 1
-            query_status = "\u2717 Query failed"
-            if self.server_info is not None:
-                info = self.server_info
-            if self.player_counts:
-                player_count = self.player_counts[-1]
-            if self.player_list:
-                players = self.player_list
+        # Test server connection over the poller's persistent socket, without blocking the Tk thread
+        self.collector.probe(lambda ping, error: self.ui.post("connection_test", self.show_connection_test, ping, error))
+
+    def show_connection_test(self, ping, error):
+        # Result of the startup probe (main thread)
+        if error is None:
+            self.status_var.set(f"Connection test successful ({ping * 1000:.0f} ms)")
         else:
-            self.query_fail_count = 0
-            query_status = "\u2713 Query successful"
-            self.server_info = info
-            self.player_list = players
-
-        # Determine current online/offline state
-        offline_now = self.query_fail_count >= 5 or (self.query_fail_count > 0 and not info)
-        online_now = not offline_now and info is not None
-
-        # Only play sound on actual state transition
-        if self._last_online_state is None:
-            # First run, set state but don't play sound
-            self._last_online_state = offline_now
-        elif self._last_online_state != offline_now:
-            # State changed
-            if offline_now:
-                self.play_sound("offline.wav")
-            else:
-                self.play_sound("online.wav")
-            self._last_online_state = offline_now
+            self.status_var.set(f"Connection failed: {str(error) or type(error).__name__}")
+
+    def update_server_info(self, state):
+        # Queue the main server's latest state for display (collector thread)
+        query_status = "\u2713 Query successful" if state.query_ok else "\u2717 Query failed"
+        current_time = datetime.fromtimestamp(state.timestamp, timezone.utc).strftime('%H:%M:%S')
+        if state.ping is not None:
+            ping_text = f"Ping: {state.ping * 1000:.0f} ms (avg {state.avg_ping * 1000:.0f} ms)"
+        else:
+            ping_text = "Ping: timed out"
+        self.ui.post(
+            "server_info", self.apply_server_info,
+            state.info, state.player_count, state.offline, query_status, current_time, ping_text
+        )
 
+    def apply_server_info(self, info, player_count, offline_now, query_status, current_time, ping_text):
+        # Show the latest server state (main thread)
         # If currently offline, stay offline until a successful query
         if offline_now:
-            self.restart_status_label.config(text="Server Status: OFFLINE", foreground="red")
-            self.cge_button.config(state=tk.DISABLED)
-            self.sourceTV_button.config(state=tk.DISABLED)
+            self.ui.config(self.restart_status_label, text="Server Status: OFFLINE", foreground="red")
+            self.ui.config(self.cge_button, state=tk.DISABLED)
+            self.ui.config(self.sourceTV_button, state=tk.DISABLED)
         elif info:
             current_map = self.update_server_display(info, player_count, query_status)
             self.update_button_states(current_map)
 
-        self.update_player_list(players)
-        self.log_and_update_graph(info.map_name if info else "Unknown", player_count, players)
-        # Only call update_ordinance_time once at startup, it will reschedule itself
-        if not hasattr(self, '_ordinance_timer_started'):
-            self._ordinance_timer_started = True
-            self.update_ordinance_time()
-        current_time = datetime.now(timezone.utc).strftime('%H:%M:%S')
+        self.ui.config(self.ping_label, text=ping_text)
         self.status_var.set(f"Last update (UTC): {current_time} | {query_status}")
-
-    def update_loop(self):
-        # Main update loop
-        while self.running:
-            try:
-                self.update_server_info()
-            except Exception:
-                pass
-            time.sleep(UPDATE_INTERVAL)
+        self.first_poll_done.set()
+
+    def update_mirrors_display(self):
+        # Show the state of every server other than the main one
+        parts = []
+        for server in self.servers:
+            if server.name == MAIN_SERVER:
+                continue
+            result = self.collector.server_results.get(server.name)
+            if result is None:
+                parts.append(f"{server.name} ?")
+            elif result.info is None:
+                parts.append(f"{server.name} \u2717")
+            else:
+                parts.append(
+                    f"{server.name} \u2713 {len(result.players)}/{result.info.max_players} ({result.latency * 1000:.0f} ms)"
+                )
+        self.ui.config(self.mirrors_label, text="Mirrors: " + (" | ".join(parts) if parts else "None configured"))
 
     def update_server_display(self, info, player_count, query_status):
         # Update server display
         current_map = "Unknown"
         
         if info:
-            self.server_name_label.config(text=f"Server Name: {info.server_name}")
-            self.server_map_label.config(text=f"Current Map: {info.map_name}")
-            self.player_count_label.config(text=f"Players: {player_count}/{info.max_players}")
+            self.ui.config(self.server_name_label, text=f"Server Name: {info.server_name}")
+            self.ui.config(self.server_map_label, text=f"Current Map: {info.map_name}")
+            self.ui.config(self.player_count_label, text=f"Players: {player_count}/{info.max_players}")
             current_map = info.map_name
             self.check_map_change(current_map)
             self.update_button_states(current_map)
         else:
-            self.server_name_label.config(text="Server Name: Unknown")
-            self.server_map_label.config(text="Current Map: Unknown")
-            self.player_count_label.config(text="Players: ?/?")
-            self.cge_button.config(state=tk.DISABLED)
-            self.sourceTV_button.config(state=tk.DISABLED)
+            self.ui.config(self.server_name_label, text="Server Name: Unknown")
+            self.ui.config(self.server_map_label, text="Current Map: Unknown")
+            self.ui.config(self.player_count_label, text="Players: ?/?")
+            self.ui.config(self.cge_button, state=tk.DISABLED)
+            self.ui.config(self.sourceTV_button, state=tk.DISABLED)
         
         return current_map
 
     def update_button_states(self, current_map):
         # Update button states
         if current_map.lower() == "2fort":
-            self.cge_button.config(state=tk.NORMAL)
+            self.ui.config(self.cge_button, state=tk.NORMAL)
         else:
-            self.cge_button.config(state=tk.DISABLED)
+            self.ui.config(self.cge_button, state=tk.DISABLED)
         
         excluded_maps = ["mazemazemazemaze", "kurt", "ask", "askask"]
         if current_map.lower() not in [m.lower() for m in excluded_maps]:
-            self.sourceTV_button.config(state=tk.NORMAL)
+            self.ui.config(self.sourceTV_button, state=tk.NORMAL)
         else:
-            self.sourceTV_button.config(state=tk.DISABLED)
-
-    def update_player_list(self, players):
-        # Update player list
-        self.player_listbox.delete(0, tk.END)
-        
-        if not players:
-            self.player_listbox.insert(tk.END, "No players online")
+            self.ui.config(self.sourceTV_button, state=tk.DISABLED)
+
+    def update_player_list(self, entries):
+        # Patch the player list row by row (main thread). Rows are in join order, so after
+        # dropping the players who left, the remaining rows line up with the new list
+        rows = self.player_rows
+        if not entries:
+            if rows != [(None, "No players online")]:
+                self.player_listbox.delete(0, tk.END)
+                self.player_listbox.insert(tk.END, "No players online")
+                self.player_rows = [(None, "No players online")]
             return
-        
-        for player in players:
+
+        keys = {entry.key for entry in entries}
+        for i in reversed(range(len(rows))):
+            if rows[i][0] not in keys:
+                self.player_listbox.delete(i)
+                del rows[i]
+
+        for i, entry in enumerate(entries):
             playtime = ""
-            if player.duration > 0:
-                hours = int(player.duration // 3600)
-                minutes = int((player.duration % 3600) // 60)
+            if entry.duration > 0:
+                hours = int(entry.duration // 3600)
+                minutes = int((entry.duration % 3600) // 60)
                 playtime = f" ({hours}h {minutes}m)"
             # If player name is empty or unreadable, show 'connecting...'
-            name = player.name if player.name and player.name.strip() else "connecting..."
-            self.player_listbox.insert(tk.END, f"{name}{playtime}")
-
-    def log_and_update_graph(self, current_map, player_count, players):
-        # Log data and update graph
-        current_time = datetime.now(timezone.utc).strftime('%H:%M:%S')
-        self.timestamps.append(current_time)
-        self.player_counts.append(player_count)
-        
-        self.log_to_csv(
-            datetime.now(timezone.utc).isoformat(),
-            player_count,
-            current_map,
-            players
-        )
-        
+            name = entry.name if entry.name and entry.name.strip() else "connecting..."
+            text = f"{name}{playtime}"
+            if i < len(rows) and rows[i][0] == entry.key:
+                if rows[i][1] != text:
+                    self.player_listbox.delete(i)
+                    self.player_listbox.insert(i, text)
+                    rows[i] = (entry.key, text)
+            else:
+                self.player_listbox.insert(i, text)
+                rows.insert(i, (entry.key, text))
+
+    def add_graph_sample(self, timestamp, player_count, failed=False):
+        # Add a sample to the graph (logging is done by the collector)
+        with self.graph_lock:
+            if self.history is None:
+                # Still loading, merged in by load_existing_data
+                self.graph_pending.append((timestamp, player_count, failed))
+            else:
+                self.history.add(timestamp, player_count, failed)
+
         self.update_graph()
 
     def update_graph(self):
-        # Update graph
-        if not self.timestamps:
+        # Request a graph redraw, repeated requests within one frame are merged
+        self.ui.post("graph", self.redraw_graph)
+
+    def redraw_graph(self):
+        # Redraw the changing artists over the cached background (main thread)
+        if self.canvas is None:
             return
-            
-        self.ax.clear()
-        
-        n = max(1, len(self.timestamps)) // 10
-        visible_ticks = [tick if i % n == 0 else "" for i, tick in enumerate(self.timestamps)]
-        
-        self.ax.plot(self.timestamps, self.player_counts, color=self.theme['plot'], marker='o')
-        self.ax.set_xticks(self.timestamps)
-        self.ax.set_xticklabels(visible_ticks, rotation=45)
-        
-        # Always show y-axis from 0 to 16 with 17 integer ticks
-        self.ax.set_ylim(0, 16)
-        self.ax.set_yticks(list(range(17)))
-        self.ax.yaxis.set_major_formatter(lambda x, pos: f"{int(x)}")
-        self.ax.set_title(f'Online Players - {CGE7_193[0]}:{CGE7_193[1]}', color=self.theme['graph_fg'])
-        self.update_graph_theme()
-        self.canvas.draw()
+        started = time.perf_counter()
+        now = time.time()
+        window = self.graph_window
+        with self.graph_lock:
+            if self.history is None:
+                return
+            width, times, average, low, high = self.history.query(now - window, now)
+        from history import band_vertices
+
+        # The x axis stays put between samples so the background can be reused, it is moved
+        # (re-anchored) when the newest sample runs past its right edge or the range changes
+        full_redraw = self.graph_background is None or window != self.graph_view or now > self.graph_right
+        if full_redraw:
+            self.set_graph_view(window, now)
+
+        x = times / 86400.0
+        self.plot_line.set_data(x, average)
+        self.plot_line.set_marker('o' if len(x) <= MAX_MARKED_POINTS else '')
+        if width and len(x):
+            # Min/max band around the bucket averages
+            self.graph_band.set_verts([band_vertices(x, low, high)])
+        else:
+            self.graph_band.set_verts([])
 
-    def update_ordinance_time(self):
-        # Update ordinance time every second
-        current_utc = datetime.now(timezone.utc)
+        if full_redraw:
+            # The draw_event handler re-captures the background and draws the artists
+            self.canvas.draw()
+            GRAPH_REDRAW.observe(time.perf_counter() - started, kind="full")
+            return
+        self.canvas.restore_region(self.graph_background)
+        self.draw_graph_artists()
+        self.canvas.blit(self.fig.bbox)
+        GRAPH_REDRAW.observe(time.perf_counter() - started, kind="blit")
+
+    def on_graph_draw(self, event):
+        # After any full draw (startup, resize, range change) cache the static background
+        self.graph_background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_graph_artists()
+
+    def draw_graph_artists(self):
+        self.ax.draw_artist(self.graph_band)
+        self.ax.draw_artist(self.plot_line)
+
+    def update_ordinance_time(self, current_utc):
+        # Update ordinance time, called from the clock tick
         time_diff = current_utc - ORDINANCE_START
 
         days = time_diff.days
@@ -778,24 +909,10 @@ class ServerMonitorApp:
         self.ordinance_var.set(
             f"Time since start of cge7-193: {days} days, {hours:02d}:{minutes:02d}:{seconds:02d}"
         )
-        # Schedule next update in 1 second
-        if hasattr(self, 'root') and self.running:
-            self.root.after(1000, self.update_ordinance_time)
 
     def play_sound(self, sound_file):
-        # Play sound file
-        if not PYGAME_AVAILABLE:
-            return
-        try:
-            sound_path = os.path.join("resources", sound_file)
-            if os.path.exists(sound_path):
-                sound = pygame.mixer.Sound(sound_path)
-                # Set volume to 50% for join.wav and information.wav
-                if sound_file in ("join.wav", "information.wav"):
-                    sound.set_volume(0.25)
-                sound.play()
-        except Exception:
-            pass
+        # Play a preloaded sound, volumes are set per sound in the sound bank
+        self.sounds.play(sound_file)
 
     def check_map_change(self, new_map):
         # Check for map change
@@ -814,80 +931,50 @@ class ServerMonitorApp:
         
         self.current_map = new_map
 
-    def start_websocket_monitor(self):
-        # Start WebSocket monitor
-        self.websocket_thread = threading.Thread(target=self.run_websocket, daemon=True)
-        self.websocket_thread.start()
+    def on_views(self, views):
+        # A batch of NEW_VIEW messages from the views feed (collector thread), shown as one update
+        latest = views[-1]
+        self.ui.post("views_display", self.update_views_display, latest.view_id, self.format_view_time(latest.timestamp))
+        new_views = [view for view in views if view.is_new]
+        if new_views:
+            newest = new_views[-1]
+            self.ui.post("new_view", self.show_new_view_notification, newest.view_id, self.format_view_time(newest.timestamp), len(new_views))
 
-    def run_websocket(self):
-        # Run WebSocket connection
-        asyncio.run(self.websocket_handler())
-
-    async def websocket_handler(self):
-        # Handle WebSocket connection
-        uri = VIEWS_WEBSOCKET_URL
-        
-        while self.websocket_running:
-            try:
-                async with websockets.connect(uri) as websocket:
-                    self.root.after(0, self.update_views_status, "Connected to WebSocket")
-                    
-                    while self.websocket_running:
-                        try:
-                            message = await asyncio.wait_for(websocket.recv(), timeout=30)
-                            self.process_websocket_message(message)
-                        except asyncio.TimeoutError:
-                            await websocket.ping()
-                            continue
-                            
-            except Exception as e:
-                self.root.after(0, self.update_views_status, f"WebSocket Error: {str(e)}")
-                await asyncio.sleep(5)
-
-    def process_websocket_message(self, message):
-        # Process WebSocket message
-        try:
-            data = json.loads(message)
-            if data.get('type') == 'NEW_VIEW':
-                view_data = data['data']
-                view_id = view_data['id']
-                timestamp = view_data['timestamp']
-                
-                cst_time = datetime.fromtimestamp(timestamp)
-                time_str = cst_time.strftime('%Y-%m-%d %I:%M:%S %p CST')
-                
-                self.root.after(0, self.update_views_display, view_id, time_str)
-                
-                if self.last_view_id is None or int(view_id) > int(self.last_view_id):
-                    self.root.after(0, self.show_new_view_notification, view_id, time_str)
-                    self.last_view_id = view_id
-                    
-        except Exception as e:
-            self.root.after(0, self.update_views_status, f"Error processing message: {str(e)}")
+    def format_view_time(self, timestamp):
+        cst_time = datetime.fromtimestamp(timestamp)
+        return cst_time.strftime('%Y-%m-%d %I:%M:%S %p CST')
 
     def update_views_display(self, view_id, timestamp):
         # Update views display
-        self.views_label.config(text=f"Current View ID: {view_id}")
-        self.last_view_time_label.config(text=f"Last View Time: {timestamp}")
+        self.ui.config(self.views_label, text=f"Current View ID: {view_id}")
+        self.ui.config(self.last_view_time_label, text=f"Last View Time: {timestamp}")
         self.update_views_status("New view received")
 
+    def show_new_view_notification(self, view_id, timestamp, count=1):
+        # Announce views newer than any seen so far, once per batch
+        self.play_sound("new_view.wav")
+        if count > 1:
+            self.status_var.set(f"{count} new views, latest: {view_id} at {timestamp}")
+        else:
+            self.status_var.set(f"New view: {view_id} at {timestamp}")
+
     def update_views_status(self, message):
         # Update views status
-        self.views_status.config(text=f"Status: {message}")
+        self.ui.config(self.views_status, text=f"Status: {message}")
 
     def on_close(self):
         # Clean up on close
         self.play_sound("close.wav")
         # wait for close.wav to finish playing before closing
-        if PYGAME_AVAILABLE:
-            import pygame
-            start = time.time()
-            # wait up to 1 seconds for sound to finish
-            while pygame.mixer.get_busy() and time.time() - start < 1:
-                self.root.update()
-                time.sleep(0.05)
+        start = time.time()
+        # wait up to 1 seconds for sound to finish
+        while self.sounds.busy() and time.time() - start < 1:
+            self.root.update()
+            time.sleep(0.05)
         self.running = False
-        self.websocket_running = False
+        self.collector.stop()
+        self.ui.stop()
+        self.clock.stop()
         self.root.destroy()
 
 def center_window(window, width, height):
@@ -899,9 +986,9 @@ def center_window(window, width, height):
     y = (screen_height // 2) - (height // 2)
     window.geometry(f"{width}x{height}+{x}+{y}")
 
-def show_thank_you():
-    # Show splash screen
-    splash = tk.Tk()
+def show_thank_you(root, sounds, preopen):
+    # Show the splash screen over the (still hidden) main window, the caller destroys it
+    splash = tk.Toplevel(root)
     splash.title("Welcome to Reployer")
     splash.configure(bg="#1e1e1e")
     splash.overrideredirect(True)  # Remove window top bar
@@ -918,23 +1005,8 @@ def show_thank_you():
     except Exception:
         pass
 
-    # Play a random preopenX.mp3 sound at 50% volume
-    try:
-        import random
-        preopen_files = ["preopen1.mp3", "preopen2.mp3", "preopen3.mp3"]
-        chosen = random.choice(preopen_files)
-        sound_path = os.path.join("resources", chosen)
-        if os.path.exists(sound_path):
-            try:
-                import pygame
-                pygame.mixer.init()
-                sound = pygame.mixer.Sound(sound_path)
-                sound.set_volume(0.5)
-                sound.play()
-            except Exception:
-                pass
-    except Exception:
-        pass
+    # Play the chosen preopenX.mp3 sound (50% volume, set in the sound bank)
+    sounds.play(preopen)
 
     # Display gaq9.png and sourceclown.png side by side at the top, with sourceclown.png resized to match gaq9.png
     try:
@@ -988,12 +1060,20 @@ def show_thank_you():
             splash.after(200, animate_loading, count + 1)
 
     animate_loading()
-    splash.after(5000, splash.destroy)
-    splash.mainloop()
+    return splash
+
+def close_splash_when_ready(app, splash, started):
+    # Swap the splash for the main window once the app is ready, or when the splash ran its time
+    if app.is_ready() or time.monotonic() - started >= SPLASH_MAX_SECONDS:
+        splash.destroy()
+        app.show()
+    else:
+        app.root.after(100, close_splash_when_ready, app, splash, started)
 
 if __name__ == "__main__":
-    show_thank_you()
+    started = time.monotonic()
     root = tk.Tk()
+    root.withdraw()
     # Set main app icon to sourceclown.ico
     try:
         icon_path = os.path.join("resources", "sourceclown.ico")
@@ -1001,7 +1081,19 @@ if __name__ == "__main__":
             root.iconbitmap(icon_path)
     except Exception:
         pass
-    center_window(root, 1500, 1000)
-    app = ServerMonitorApp(root)
+    # The splash sound is decoded first so it can start while everything else loads
+    sounds = SoundBank(RESOURCE_DIR)
+    preopen = random.choice(PREOPEN_SOUNDS)
+    sounds.preload(first=[preopen])
+    splash = show_thank_you(root, sounds, preopen)
+    splash.update()
+    # --hub [ws://host:port] subscribes to a running hub.py instead of polling the server
+    hub_url = None
+    if "--hub" in sys.argv[1:]:
+        from hub import HUB_URL
+        following = sys.argv[sys.argv.index("--hub") + 1:]
+        hub_url = following[0] if following and following[0].startswith("ws") else HUB_URL
+    app = ServerMonitorApp(root, sounds, hub_url)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
+    close_splash_when_ready(app, splash, started)
     root.mainloop()
\ No newline at end of file
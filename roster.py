@@ -0,0 +1,124 @@
+import csv
+import itertools
+import os
+import sys
+from collections import deque, namedtuple
+
+# A player's duration should have grown by the time between two polls, falling short of that
+# by more than this many seconds means they reconnected and a new session started
+DURATION_TOLERANCE = 5
+# Finished sessions kept in memory for quick lookups, the event log has all of them
+SESSION_HISTORY = 1000
+ROSTER_LOG_FILENAME = "roster_events.csv"
+
+# kind is "join" or "leave". For joins timestamp is when the player connected (poll time minus
+# their reported duration), for leaves the last poll they were seen in
+RosterEvent = namedtuple('RosterEvent', ['kind', 'name', 'timestamp', 'session'])
+
+# One row of the player list: a stable key per session, the name and the current duration
+RosterEntry = namedtuple('RosterEntry', ['key', 'name', 'duration'])
+
+
+class Session:
+    # One continuous stay of a player on the server
+    __slots__ = ('key', 'name', 'joined', 'last_seen', 'duration', 'score')
+
+    def __init__(self, key, name, joined, last_seen, duration, score):
+        self.key = key
+        self.name = name
+        self.joined = joined
+        self.last_seen = last_seen
+        self.duration = duration
+        self.score = score
+
+    @property
+    def length(self):
+        return self.last_seen - self.joined
+
+
+class Roster:
+    # Diffs successive player lists into join/leave events. Players are matched by name and
+    # by their duration carrying on from the previous poll
+    def __init__(self, history=SESSION_HISTORY):
+        self.online = {}  # name -> [Session], longest first
+        self.finished = deque(maxlen=history)
+        self.keys = itertools.count()
+
+    def update(self, players, timestamp):
+        # Apply one successful poll, returns the events it caused
+        events = []
+        current = {}
+        for player in players:
+            current.setdefault(sys.intern(player.name), []).append(player)
+
+        for name in list(self.online):
+            if name not in current:
+                for session in self.online.pop(name):
+                    events.append(self.end(session))
+
+        for name, group in current.items():
+            group.sort(key=lambda player: player.duration, reverse=True)
+            previous = self.online.get(name, [])
+            sessions = []
+            for i, player in enumerate(group):
+                session = previous[i] if i < len(previous) else None
+                expected = session.duration + (timestamp - session.last_seen) if session is not None else 0
+                if session is not None and player.duration + DURATION_TOLERANCE < expected:
+                    # Duration restarted: left and came back between two polls
+                    events.append(self.end(session))
+                    session = None
+                if session is None:
+                    session = Session(next(self.keys), name, timestamp - player.duration, timestamp, player.duration, player.score)
+                    events.append(RosterEvent("join", name, session.joined, session))
+                else:
+                    session.last_seen = timestamp
+                    session.duration = player.duration
+                    session.score = player.score
+                sessions.append(session)
+            for session in previous[len(group):]:
+                events.append(self.end(session))
+            self.online[name] = sessions
+        return events
+
+    def clear(self):
+        # The server went away, every session ends where it was last seen
+        events = [self.end(session) for sessions in self.online.values() for session in sessions]
+        self.online = {}
+        return events
+
+    def end(self, session):
+        self.finished.append(session)
+        return RosterEvent("leave", session.name, session.last_seen, session)
+
+    def snapshot(self):
+        # Current players in join order as immutable rows, safe to hand to another thread
+        sessions = sorted((session for group in self.online.values() for session in group), key=lambda session: session.key)
+        return [RosterEntry(session.key, session.name, session.duration) for session in sessions]
+
+
+class RosterLog:
+    # Append-only CSV of join/leave events: timestamp,event,name,duration
+    def __init__(self, directory, filename=ROSTER_LOG_FILENAME):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, 'a', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        if is_new:
+            self.writer.writerow(['timestamp', 'event', 'name', 'duration'])
+
+    def write(self, events):
+        if not events:
+            return
+        for event in events:
+            self.writer.writerow([int(event.timestamp), event.kind, event.name, int(event.session.length)])
+
+    def flush(self):
+        self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
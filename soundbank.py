@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+SOUND_EXTENSIONS = ('.wav', '.mp3')
+
+# Per-sound volume, anything not listed plays at full volume
+DEFAULT_VOLUMES = {
+    'hover.wav': 0.25,
+    'join.wav': 0.25,
+    'information.wav': 0.25,
+    'preopen1.mp3': 0.5,
+    'preopen2.mp3': 0.5,
+    'preopen3.mp3': 0.5,
+}
+
+# Sounds with a mixer channel of their own: replaying one cuts off its previous play
+# instead of stacking up or stealing a channel from other sounds
+RESERVED_CHANNELS = ('hover.wav', 'close.wav')
+
+# Sounds requested before the bank finished loading are still played if they are this fresh
+DEFERRED_MAX_AGE = 1.0
+
+
+class SoundBank:
+    # Decodes every sound in the resources folder once, off the Tk thread
+    def __init__(self, directory="resources", volumes=None, reserved=RESERVED_CHANNELS):
+        self.directory = directory
+        self.volumes = dict(DEFAULT_VOLUMES if volumes is None else volumes)
+        self.reserved = tuple(reserved)
+        self.sounds = {}
+        self.channels = {}
+        self.deferred = []
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+        self.available = False
+        self.mixer = None
+
+    def preload(self, first=()):
+        # Load everything in a background thread, sounds named in `first` before the rest
+        threading.Thread(target=self.load, args=(tuple(first),), daemon=True).start()
+
+    def load(self, first=()):
+        try:
+            import pygame
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            self.mixer = pygame.mixer
+            pygame.mixer.set_reserved(len(self.reserved))
+            self.channels = {name: pygame.mixer.Channel(i) for i, name in enumerate(self.reserved)}
+        except Exception:
+            # No pygame or no audio device, play() becomes a no-op
+            with self.lock:
+                self.deferred = []
+            self.loaded.set()
+            return
+
+        try:
+            entries = sorted(os.scandir(self.directory), key=lambda entry: (entry.name not in first, entry.name))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.name.lower().endswith(SOUND_EXTENSIONS):
+                continue
+            try:
+                # Skip zero-byte placeholders
+                if entry.stat().st_size == 0:
+                    continue
+                sound = self.mixer.Sound(entry.path)
+                sound.set_volume(self.volumes.get(entry.name, 1.0))
+            except Exception:
+                continue
+            # Publish each sound as soon as it is decoded so early requests for it play right away
+            with self.lock:
+                self.sounds[entry.name] = sound
+                requests = [requested for name, requested in self.deferred if name == entry.name]
+                self.deferred = [request for request in self.deferred if request[0] != entry.name]
+            now = time.monotonic()
+            if any(now - requested <= DEFERRED_MAX_AGE for requested in requests):
+                self.play(entry.name)
+
+        with self.lock:
+            self.available = True
+            self.deferred = []
+        self.loaded.set()
+
+    def play(self, name):
+        # Play a preloaded sound, never touches the disk
+        if self.loaded.is_set():
+            sound = self.sounds.get(name)
+        else:
+            with self.lock:
+                sound = self.sounds.get(name)
+                if sound is None and not self.available:
+                    self.deferred.append((name, time.monotonic()))
+                    return
+        if sound is None:
+            return
+        try:
+            channel = self.channels.get(name)
+            if channel is not None:
+                channel.play(sound)
+            else:
+                sound.play()
+        except Exception:
+            pass
+
+    def busy(self):
+        if self.mixer is None:
+            return False
+        try:
+            return self.mixer.get_busy()
+        except Exception:
+            return False
@@ -0,0 +1,221 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from history import RECORD_DTYPE
+from map_schedule import load_schedule
+from timeseries import FLAG_QUERY_FAILED, HISTORY_DIR, TimeSeriesStore
+
+# Player history analytics, run as `python reployer.py stats` (or `python stats.py`).
+# The store is read in chunks of raw records into numpy arrays, so memory use does not grow
+# with the size of the log
+
+CHUNK_RECORDS = 1 << 20
+# Time between two samples counts as time online for the players of the later one, up to this
+# many seconds (longer gaps mean the logger was not running)
+MAX_SAMPLE_GAP = 60
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HEAT_SHADES = " .:-=+*#%@"
+
+
+class Stats:
+    # Running totals over the log, fed one chunk of records at a time
+    def __init__(self, map_count, set_count):
+        self.samples = 0
+        self.failed = 0
+        self.first = None
+        self.last = None
+        self.previous_time = None
+        self.map_total = np.zeros(map_count, dtype=np.float64)
+        self.map_samples = np.zeros(map_count, dtype=np.int64)
+        self.map_peak = np.zeros(map_count, dtype=np.int64)
+        # weekday x hour of day
+        self.heat_total = np.zeros(7 * 24, dtype=np.float64)
+        self.heat_samples = np.zeros(7 * 24, dtype=np.int64)
+        self.hour_peak = np.zeros(24, dtype=np.int64)
+        # hour of day x map, to find the map actually seen most at each hour
+        self.hour_maps = np.zeros(24 * map_count, dtype=np.int64)
+        self.set_seconds = np.zeros(set_count, dtype=np.float64)
+        self.map_count = map_count
+
+    def add(self, records):
+        if not len(records):
+            return
+        times = records['timestamp'].astype(np.int64)
+        counts = records['player_count'].astype(np.int64)
+        ok = (records['flags'] & FLAG_QUERY_FAILED) == 0
+
+        self.samples += len(records)
+        self.failed += int(len(records) - ok.sum())
+        if self.first is None:
+            self.first = int(times[0])
+        self.last = int(times[-1])
+
+        # Gap to the previous sample, carried over between chunks
+        previous = np.empty_like(times)
+        previous[0] = times[0] if self.previous_time is None else self.previous_time
+        previous[1:] = times[:-1]
+        gaps = np.clip(times - previous, 0, MAX_SAMPLE_GAP)
+        self.previous_time = int(times[-1])
+
+        times, counts, gaps = times[ok], counts[ok], gaps[ok]
+        map_ids = records['map_id'][ok].astype(np.int64)
+        set_ids = records['set_id'][ok].astype(np.int64)
+
+        self.map_total += np.bincount(map_ids, weights=counts, minlength=self.map_count)
+        self.map_samples += np.bincount(map_ids, minlength=self.map_count)
+        np.maximum.at(self.map_peak, map_ids, counts)
+
+        hours = (times // 3600) % 24
+        # 1970-01-01 was a Thursday
+        weekdays = (times // 86400 + 3) % 7
+        cells = weekdays * 24 + hours
+        self.heat_total += np.bincount(cells, weights=counts, minlength=7 * 24)
+        self.heat_samples += np.bincount(cells, minlength=7 * 24)
+        np.maximum.at(self.hour_peak, hours, counts)
+        self.hour_maps += np.bincount(hours * self.map_count + map_ids, minlength=24 * self.map_count)
+
+        self.set_seconds += np.bincount(set_ids, weights=gaps, minlength=len(self.set_seconds))
+
+
+def collect(store, since=None, chunk_records=CHUNK_RECORDS):
+    start_index = store.find(since) if since is not None else 0
+    stats = Stats(len(store.strings.strings), len(store.sets.sets))
+    for chunk in store.read_raw(start_index, chunk_records):
+        stats.add(np.frombuffer(chunk, dtype=RECORD_DTYPE))
+    return stats
+
+
+def summarize(stats, store, schedule, top=10):
+    # Plain data for printing or JSON output
+    strings = store.strings.strings
+    maps = []
+    for map_id in np.flatnonzero(stats.map_samples):
+        maps.append({
+            'map': strings[map_id],
+            'samples': int(stats.map_samples[map_id]),
+            'average': float(stats.map_total[map_id] / stats.map_samples[map_id]),
+            'peak': int(stats.map_peak[map_id]),
+        })
+    maps.sort(key=lambda entry: entry['average'], reverse=True)
+
+    hour_maps = stats.hour_maps.reshape(24, stats.map_count)
+    hour_total = stats.heat_total.reshape(7, 24).sum(axis=0)
+    hour_samples = stats.heat_samples.reshape(7, 24).sum(axis=0)
+    hours = []
+    for hour in range(24):
+        seen = hour_maps[hour]
+        hours.append({
+            'hour': hour,
+            'scheduled': schedule.map_at_hour(hour) if schedule else None,
+            'seen': strings[int(seen.argmax())] if seen.any() else None,
+            'average': float(hour_total[hour] / hour_samples[hour]) if hour_samples[hour] else None,
+            'peak': int(stats.hour_peak[hour]),
+        })
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        heat = np.where(stats.heat_samples > 0, stats.heat_total / stats.heat_samples, np.nan).reshape(7, 24)
+
+    # Spread the time of each player set over its members
+    seconds = {}
+    for set_id in np.flatnonzero(stats.set_seconds):
+        for string_id in store.sets.sets[set_id]:
+            seconds[string_id] = seconds.get(string_id, 0.0) + stats.set_seconds[set_id]
+    players = sorted(seconds.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    return {
+        'first': stats.first,
+        'last': stats.last,
+        'samples': stats.samples,
+        'uptime': (stats.samples - stats.failed) / stats.samples if stats.samples else None,
+        'maps': maps,
+        'hours': hours,
+        'heatmap': [[None if np.isnan(value) else round(float(value), 2) for value in row] for row in heat],
+        'players': [{'name': strings[string_id], 'seconds': int(total)} for string_id, total in players],
+    }
+
+
+def format_duration(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def format_time(epoch):
+    return time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(epoch))
+
+
+def shade(value, top):
+    # One heatmap cell, blank when there were no samples
+    if value is None:
+        return " "
+    if not top:
+        return HEAT_SHADES[0]
+    return HEAT_SHADES[min(int(value / top * len(HEAT_SHADES)), len(HEAT_SHADES) - 1)]
+
+
+def print_summary(summary):
+    if not summary['samples']:
+        print("No samples in the history")
+        return
+    print(f"{summary['samples']} samples from {format_time(summary['first'])} to {format_time(summary['last'])}")
+    print(f"Uptime: {summary['uptime'] * 100:.2f}% of queries answered")
+
+    print("\nPlayers by map")
+    print(f"  {'map':<24} {'avg':>6} {'peak':>5} {'samples':>9}")
+    for entry in summary['maps']:
+        print(f"  {entry['map']:<24} {entry['average']:>6.2f} {entry['peak']:>5} {entry['samples']:>9}")
+
+    print("\nPlayers by hour (UTC)")
+    print(f"  {'hour':<5} {'scheduled':<20} {'seen most':<20} {'avg':>6} {'peak':>5}")
+    for entry in summary['hours']:
+        average = f"{entry['average']:.2f}" if entry['average'] is not None else "-"
+        print(f"  {entry['hour']:02d}    {entry['scheduled'] or '-':<20} {entry['seen'] or '-':<20} {average:>6} {entry['peak']:>5}")
+
+    print("\nAverage players, weekday x hour (UTC), darker is busier")
+    values = [value for row in summary['heatmap'] for value in row if value is not None]
+    top = max(values) if values else 0
+    print("       " + "".join(f"{hour:<6d}" for hour in range(0, 24, 6)))
+    for name, row in zip(WEEKDAYS, summary['heatmap']):
+        print(f"  {name}  {''.join(shade(value, top) for value in row)}")
+
+    print("\nTop players by time online")
+    for rank, entry in enumerate(summary['players'], 1):
+        print(f"  {rank:>3}. {entry['name'] or '(connecting)':<32} {format_duration(entry['seconds'])}")
+
+
+def main(argv=None):
+    #   python reployer.py stats
+    #   python reployer.py stats --days 7 --top 20 --json
+    parser = argparse.ArgumentParser(prog="reployer stats", description="CGE7-193 player history statistics")
+    parser.add_argument('--dir', default=HISTORY_DIR, help="history folder (default: %(default)s)")
+    parser.add_argument('--days', type=float, help="only look at the last N days")
+    parser.add_argument('--top', type=int, default=10, metavar='N', help="number of players to list")
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args(argv)
+
+    # Read-only: the GUI, headless mode or the hub may be writing the same history
+    store = TimeSeriesStore(args.dir, readonly=True)
+    try:
+        since = time.time() - args.days * 86400 if args.days else None
+        stats = collect(store, since)
+        try:
+            schedule = load_schedule()
+        except (OSError, ValueError, KeyError):
+            schedule = None
+        summary = summarize(stats, store, schedule, args.top)
+    finally:
+        store.close()
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import heapq
+import itertools
+import time
+from datetime import datetime, timezone
+
+from metrics import ERRORS
+
+
+class SecondTicker:
+    # Calls on_tick(utc_now) once per wall-clock second, scheduled to land just after each
+    # second boundary instead of polling at a fixed rate
+    def __init__(self, root, on_tick):
+        self.root = root
+        self.on_tick = on_tick
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.tick()
+
+    def stop(self):
+        self.running = False
+
+    def tick(self):
+        if not self.running:
+            return
+        try:
+            self.on_tick(datetime.now(timezone.utc))
+        except Exception:
+            ERRORS.inc(where="clock")
+        # Aim a couple of milliseconds past the next boundary so the clock never reads the old second
+        delay_ms = int((1 - time.time() % 1) * 1000) + 2
+        self.root.after(delay_ms, self.tick)
+
+
+class TimedEvents:
+    # Hourly events at fixed mm:ss marks, kept in a heap ordered by their next due time.
+    # A late tick fires everything that came due since the last one, so no mark is skipped
+    def __init__(self):
+        self.heap = []
+        self.order = itertools.count()
+
+    def add_hourly(self, minute, second, callback, now=None):
+        now = time.time() if now is None else now
+        when = now - now % 3600 + minute * 60 + second
+        if when < int(now):
+            when += 3600
+        heapq.heappush(self.heap, (when, next(self.order), callback))
+
+    def run_due(self, now=None):
+        now = time.time() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            when, _, callback = heapq.heappop(self.heap)
+            try:
+                callback()
+            except Exception:
+                ERRORS.inc(where="timed_event")
+            # Re-arm for the next hour, skipping hours missed while asleep rather than replaying them
+            when += 3600
+            while when <= now:
+                when += 3600
+            heapq.heappush(self.heap, (when, next(self.order), callback))
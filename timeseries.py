@@ -0,0 +1,562 @@
+import csv
+import gzip
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+# Append-only player history: one fixed-width record per sample, with map and player names
+# interned into a string table and each distinct roster stored once as a player set
+HISTORY_DIR = "history"
+SAMPLES_FILE = "samples.dat"
+STRINGS_FILE = "strings.dat"
+SETS_FILE = "sets.dat"
+SEGMENTS_INDEX = "segments.json"
+
+# epoch seconds, map id, player set id, player count, flags, padding
+RECORD = struct.Struct('<IIIHBx')
+RECORD_TIME = struct.Struct('<I')
+STRING_HEADER = struct.Struct('<H')
+SET_HEADER = struct.Struct('<H')
+SET_ITEM = struct.Struct('<I')
+FLAG_QUERY_FAILED = 0x01
+
+# Records are buffered and written out in batches of this many samples (one minute at 5 s)
+FLUSH_EVERY = 12
+
+# samples.dat only holds the current UTC day. Older days (or anything past SEGMENT_MAX_BYTES) are
+# moved to compressed, read-only segment files listed in segments.json with their time range
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+SEGMENT_SUFFIX = ".dat.zst" if zstd is not None else ".dat.gz"
+
+CSV_HEADER = ['UTC Timestamp', 'Player Count', 'Map', 'Players Online']
+
+Sample = namedtuple('Sample', ['timestamp', 'player_count', 'map_name', 'players', 'failed'])
+
+# An archived segment: file name, first and last timestamp, number of records
+Segment = namedtuple('Segment', ['file', 'first', 'last', 'count'])
+
+
+def open_segment(path, mode='rb'):
+    if path.endswith('.zst'):
+        return zstd.open(path, mode)
+    return gzip.open(path, mode)
+
+
+class StringTable:
+    # Interned strings, persisted as length-prefixed UTF-8 in insertion order. Read-only tables
+    # never open the file for writing
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.strings = []
+        self.ids = {}
+        self.pending = []
+        self.load()
+        self.file = None if readonly else open(self.path, 'ab')
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        pos = 0
+        while pos + STRING_HEADER.size <= len(data):
+            (length,) = STRING_HEADER.unpack_from(data, pos)
+            end = pos + STRING_HEADER.size + length
+            if end > len(data):
+                break
+            self.add(data[pos + STRING_HEADER.size:end].decode('utf-8', errors='replace'))
+            pos = end
+        if pos != len(data) and not self.readonly:
+            # Drop a partially written entry left by a crash
+            with open(self.path, 'r+b') as f:
+                f.truncate(pos)
+
+    def add(self, value):
+        value = sys.intern(value)
+        self.ids[value] = len(self.strings)
+        self.strings.append(value)
+        return self.ids[value]
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.add(value)
+            encoded = value.encode('utf-8')[:0xFFFF]
+            self.pending.append(STRING_HEADER.pack(len(encoded)) + encoded)
+        return string_id
+
+    def flush(self):
+        if self.file is None:
+            return
+        if self.pending:
+            self.file.write(b''.join(self.pending))
+            self.pending.clear()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+
+class PlayerSetTable:
+    # Distinct rosters, each stored once as a sorted tuple of string ids
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.sets = []
+        self.ids = {}
+        self.pending = []
+        self.load()
+        self.file = None if readonly else open(self.path, 'ab')
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        pos = 0
+        while pos + SET_HEADER.size <= len(data):
+            (count,) = SET_HEADER.unpack_from(data, pos)
+            end = pos + SET_HEADER.size + count * SET_ITEM.size
+            if end > len(data):
+                break
+            members = tuple(v for (v,) in SET_ITEM.iter_unpack(data[pos + SET_HEADER.size:end]))
+            self.ids[members] = len(self.sets)
+            self.sets.append(members)
+            pos = end
+        if pos != len(data) and not self.readonly:
+            with open(self.path, 'r+b') as f:
+                f.truncate(pos)
+
+    def intern(self, members):
+        members = tuple(sorted(set(members)))
+        set_id = self.ids.get(members)
+        if set_id is None:
+            set_id = len(self.sets)
+            self.ids[members] = set_id
+            self.sets.append(members)
+            self.pending.append(SET_HEADER.pack(len(members)) + b''.join(SET_ITEM.pack(m) for m in members))
+        return set_id
+
+    def flush(self):
+        if self.file is None:
+            return
+        if self.pending:
+            self.file.write(b''.join(self.pending))
+            self.pending.clear()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+
+class TimeSeriesStore:
+    # Columnar sample log with a single open handle per file and batched writes. Record indexes
+    # and all readers run across the archived segments first, then samples.dat.
+    # readonly=True is for reports run next to a process that is writing the same history: no
+    # repair, no truncation and no file opened for writing, a record still being written is
+    # simply not read yet
+    def __init__(self, directory=HISTORY_DIR, flush_every=FLUSH_EVERY, keep_segments=None, readonly=False):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.keep_segments = keep_segments
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        self.strings = StringTable(os.path.join(directory, STRINGS_FILE), readonly)
+        self.sets = PlayerSetTable(os.path.join(directory, SETS_FILE), readonly)
+        self.samples_path = os.path.join(directory, SAMPLES_FILE)
+        self.index_path = os.path.join(directory, SEGMENTS_INDEX)
+        self.segments = self.load_index()
+        self.pending = []
+        if readonly:
+            # Records a crash left in samples.dat after archiving them are skipped, not removed
+            self.live_skip = self.archived_live_records()
+            self.samples_file = None
+            self.live_first = None
+        else:
+            self.live_skip = 0
+            self.repair_samples()
+            self.samples_file = open(self.samples_path, 'ab')
+            self.live_first = self.first_live_timestamp()
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            segments = [Segment(entry['file'], entry['first'], entry['last'], entry['count']) for entry in entries]
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+        # A segment whose file is gone is skipped rather than breaking every reader
+        return [segment for segment in segments if os.path.exists(os.path.join(self.directory, segment.file))]
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([segment._asdict() for segment in self.segments], f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def archived_live_records(self):
+        # Leading samples.dat records already in the last segment
+        if not self.segments or not os.path.exists(self.samples_path):
+            return 0
+        archived_until = self.segments[-1].last
+        count = 0
+        with open(self.samples_path, 'rb') as f:
+            while True:
+                data = f.read(RECORD.size)
+                if len(data) < RECORD.size or RECORD_TIME.unpack_from(data)[0] > archived_until:
+                    return count
+                count += 1
+
+    def live_records(self):
+        # Whole records in samples.dat that readers see
+        if self.samples_file is not None:
+            return self.samples_file.tell() // RECORD.size + len(self.pending)
+        try:
+            return max(os.path.getsize(self.samples_path) // RECORD.size - self.live_skip, 0)
+        except OSError:
+            return 0
+
+    def repair_samples(self):
+        # Trim a partially written trailing record, and drop records that were already archived
+        # when a crash hit between writing a segment and emptying samples.dat
+        if not os.path.exists(self.samples_path):
+            return
+        size = os.path.getsize(self.samples_path)
+        if size % RECORD.size:
+            with open(self.samples_path, 'r+b') as f:
+                f.truncate(size - size % RECORD.size)
+        if self.segments and size >= RECORD.size:
+            with open(self.samples_path, 'rb') as f:
+                data = f.read()
+            archived_until = self.segments[-1].last
+            keep = 0
+            while keep < len(data) and RECORD_TIME.unpack_from(data, keep)[0] <= archived_until:
+                keep += RECORD.size
+            if keep:
+                with open(self.samples_path, 'wb') as f:
+                    f.write(data[keep:])
+
+    def first_live_timestamp(self):
+        with open(self.samples_path, 'rb') as f:
+            data = f.read(RECORD_TIME.size)
+        return RECORD_TIME.unpack(data)[0] if len(data) == RECORD_TIME.size else None
+
+    def append(self, timestamp, player_count, map_name, player_names, failed=False):
+        # Queue one sample, written out with the next batch
+        if self.readonly:
+            raise OSError(f"{self.directory} is open read-only")
+        with self.lock:
+            timestamp = int(timestamp)
+            if self.live_first is None:
+                self.live_first = timestamp
+            elif (timestamp // 86400 != self.live_first // 86400
+                    or self.samples_file.tell() + len(self.pending) * RECORD.size >= SEGMENT_MAX_BYTES):
+                self.rotate_locked()
+                self.live_first = timestamp
+            map_id = self.strings.intern(map_name or "Unknown")
+            set_id = self.sets.intern(self.strings.intern(name) for name in player_names)
+            flags = FLAG_QUERY_FAILED if failed else 0
+            self.pending.append(RECORD.pack(timestamp, map_id, set_id, min(int(player_count), 0xFFFF), flags))
+            if len(self.pending) >= self.flush_every:
+                self.flush_locked()
+
+    def rotate_locked(self):
+        # Compress samples.dat into a new segment, index it, then start samples.dat afresh.
+        # A crash between the index update and the truncate is undone by repair_samples()
+        self.flush_locked()
+        with open(self.samples_path, 'rb') as f:
+            data = f.read()
+        count = len(data) // RECORD.size
+        if not count:
+            return
+        first = RECORD_TIME.unpack_from(data, 0)[0]
+        last = RECORD_TIME.unpack_from(data, (count - 1) * RECORD.size)[0]
+        name = f"samples-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(first))}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        with open_segment(path + '.tmp', 'wb') as f:
+            f.write(data[:count * RECORD.size])
+        os.replace(path + '.tmp', path)
+        self.segments.append(Segment(name, first, last, count))
+        self.prune_segments()
+        self.save_index()
+
+        self.samples_file.close()
+        self.samples_file = open(self.samples_path, 'wb')
+
+    def prune_segments(self):
+        # Delete the oldest segments beyond keep_segments (None keeps everything)
+        if self.keep_segments is None:
+            return
+        while len(self.segments) > self.keep_segments:
+            segment = self.segments.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, segment.file))
+            except OSError:
+                pass
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        # Strings and sets go first so a record never points at an id that is not on disk
+        if self.readonly:
+            return
+        self.strings.flush()
+        self.sets.flush()
+        if self.pending:
+            self.samples_file.write(b''.join(self.pending))
+            self.pending.clear()
+        self.samples_file.flush()
+
+    def sync(self):
+        # Flush and push every file to the disk
+        if self.readonly:
+            return
+        with self.lock:
+            self.flush_locked()
+            for f in (self.strings.file, self.sets.file, self.samples_file):
+                os.fsync(f.fileno())
+
+    def close(self):
+        with self.lock:
+            self.flush_locked()
+            if self.samples_file is not None:
+                self.samples_file.close()
+            self.strings.close()
+            self.sets.close()
+
+    def __len__(self):
+        with self.lock:
+            return sum(segment.count for segment in self.segments) + self.live_records()
+
+    def last_timestamp(self):
+        # Timestamp of the newest record, None when the store is empty
+        with self.lock:
+            if self.pending:
+                return RECORD_TIME.unpack_from(self.pending[-1])[0]
+            if self.samples_file is not None:
+                self.samples_file.flush()
+            if self.live_records():
+                size = os.path.getsize(self.samples_path)
+                with open(self.samples_path, 'rb') as f:
+                    f.seek(size - size % RECORD.size - RECORD.size)
+                    return RECORD_TIME.unpack(f.read(RECORD_TIME.size))[0]
+            return self.segments[-1].last if self.segments else None
+
+    def discard(self):
+        # Close the store and delete all of its files
+        self.close()
+        paths = [self.samples_path, self.index_path, self.strings.path, self.sets.path]
+        paths += [os.path.join(self.directory, segment.file) for segment in self.segments]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def decode(self, record):
+        # Turn a raw record into a Sample with names resolved
+        timestamp, map_id, set_id, player_count, flags = RECORD.unpack(record)
+        strings = self.strings.strings
+        players = tuple(strings[i] for i in self.sets.sets[set_id])
+        return Sample(timestamp, player_count, strings[map_id], players, bool(flags & FLAG_QUERY_FAILED))
+
+    def read_raw(self, start_index=0, chunk_records=65536):
+        # Stored records as raw bytes in chunks of whole records, for bulk (numpy) readers.
+        # Segments that end before start_index are never opened
+        self.flush()
+        segments = list(self.segments)
+        base = 0
+        for segment in segments:
+            if start_index < base + segment.count:
+                with open_segment(os.path.join(self.directory, segment.file)) as f:
+                    yield from self.read_chunks(f, max(0, start_index - base), chunk_records)
+            base += segment.count
+        if not os.path.exists(self.samples_path):
+            return
+        with open(self.samples_path, 'rb') as f:
+            yield from self.read_chunks(f, max(0, start_index - base) + self.live_skip, chunk_records)
+
+    def read_chunks(self, f, skip, chunk_records):
+        if skip:
+            f.seek(skip * RECORD.size)
+        while True:
+            chunk = f.read(RECORD.size * chunk_records)
+            complete = chunk[:len(chunk) - len(chunk) % RECORD.size]
+            if complete:
+                yield complete
+            if len(chunk) < RECORD.size * chunk_records:
+                # End of file. A record being appended right now is left for the next reader,
+                # reading on would start in the middle of it
+                break
+
+    def read(self, start_index=0):
+        # Iterate over stored samples from a record index onwards, oldest first
+        for chunk in self.read_raw(start_index, 4096):
+            for offset in range(0, len(chunk), RECORD.size):
+                yield self.decode(chunk[offset:offset + RECORD.size])
+
+    def find(self, timestamp):
+        # Index of the first record at or after `timestamp`. The segment index narrows it down to
+        # one file, which is then binary searched (samples are appended in time order)
+        self.flush()
+        segments = list(self.segments)
+        base = 0
+        for segment in segments:
+            if timestamp <= segment.last:
+                with open_segment(os.path.join(self.directory, segment.file)) as f:
+                    return base + self.search(f.read(), timestamp)
+            base += segment.count
+        if not os.path.exists(self.samples_path):
+            return base
+        with open(self.samples_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return base
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return base + max(self.search(data, timestamp) - self.live_skip, 0)
+
+    def search(self, data, timestamp):
+        lo, hi = 0, len(data) // RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD_TIME.unpack_from(data, mid * RECORD.size)[0] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+def parse_csv_timestamp(value):
+    # Epoch seconds from the "UTC Timestamp" column: ISO 8601 with or without offset ("Z",
+    # "+00:00", naive taken as UTC), with a space or a T, or plain epoch seconds
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        pass
+    else:
+        # "inf", "nan" and "1e400" parse as floats but are no time
+        if not math.isfinite(number):
+            raise ValueError("not a finite number")
+        return int(number)
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def parse_csv_players(value):
+    if not value or value == "None":
+        return []
+    return value.split(", ")
+
+
+def parse_csv_row(row):
+    # One player_log.csv row (from csv.DictReader) as a Sample that fits a record, raises
+    # ValueError with the reason when it cannot be used
+    if None in row or any(row.get(column) is None for column in CSV_HEADER):
+        raise ValueError("wrong number of columns")
+    try:
+        timestamp = parse_csv_timestamp(row['UTC Timestamp'])
+    except (ValueError, OverflowError):
+        raise ValueError("bad timestamp")
+    if not 0 <= timestamp <= 0xFFFFFFFF:
+        raise ValueError("timestamp out of range")
+    try:
+        player_count = int(row['Player Count'].strip())
+    except ValueError:
+        raise ValueError("bad player count")
+    if player_count < 0:
+        raise ValueError("negative player count")
+    map_name = row['Map'].strip() or "Unknown"
+    players = tuple(parse_csv_players(row['Players Online']))
+    return Sample(timestamp, player_count, map_name, players, map_name == "Unknown")
+
+
+def import_csv(store, csv_path):
+    # Append every usable row of a player_log.csv in time order, returns (imported, skipped).
+    # Rows not newer than what the store already holds are skipped too, merging those in is what
+    # `reployer import` (backfill.py) is for
+    samples = []
+    skipped = 0
+    with open(csv_path, 'r', newline='', encoding='utf-8', errors='replace') as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                samples.append(parse_csv_row(row))
+            except ValueError:
+                skipped += 1
+    # Python's sort is stable, rows logged within one second keep their file order
+    samples.sort(key=lambda sample: sample.timestamp)
+    last = store.last_timestamp()
+    imported = 0
+    for sample in samples:
+        if last is not None and sample.timestamp <= last:
+            skipped += 1
+            continue
+        store.append(sample.timestamp, sample.player_count, sample.map_name, sample.players, sample.failed)
+        imported += 1
+    store.flush()
+    return imported, skipped
+
+
+def export_csv(store, csv_path):
+    # Write the whole history back out in the old player_log.csv format
+    exported = 0
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_HEADER)
+        for sample in store.read():
+            timestamp = datetime.fromtimestamp(sample.timestamp, timezone.utc).isoformat()
+            players = ", ".join(sample.players) if sample.players else "None"
+            writer.writerow([timestamp, sample.player_count, sample.map_name, players])
+            exported += 1
+    return exported
+
+
+def main(argv=None):
+    # python timeseries.py import player_log.csv [history_dir]
+    # python timeseries.py export out.csv [history_dir]
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ("import", "export"):
+        print("Usage: timeseries.py import|export <file.csv> [history_dir]")
+        return 2
+    command, csv_path = argv[0], argv[1]
+    directory = argv[2] if len(argv) > 2 else HISTORY_DIR
+    # Exporting only reads, it may run next to a collector writing the same history
+    store = TimeSeriesStore(directory, readonly=command == "export")
+    try:
+        if command == "import":
+            imported, skipped = import_csv(store, csv_path)
+            print(f"Imported {imported} samples from {csv_path} ({skipped} unusable or already imported rows skipped)")
+        else:
+            exported = export_csv(store, csv_path)
+            print(f"Exported {exported} samples to {csv_path}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
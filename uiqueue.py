@@ -0,0 +1,74 @@
+import itertools
+import threading
+import time
+
+from metrics import ERRORS, histogram
+
+# How late the Tk main loop runs the drain timer: time spent in other callbacks, redraws and
+# event handling that the UI could not respond during
+UI_LAG = histogram("reployer_ui_lag_seconds", "Tk event loop lag, measured on the UI update timer")
+UI_DRAIN = histogram("reployer_ui_drain_seconds", "Time spent applying one frame of UI updates")
+
+
+class UIUpdateQueue:
+    # Hands UI work from background threads to the Tk main loop, which drains it on a timer.
+    # Updates are keyed: posting a key again before the next drain replaces the pending update,
+    # so only the latest state of each widget is applied per frame
+    def __init__(self, root, interval_ms=50):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.applied = {}
+        self.unique_keys = itertools.count()
+        self.running = False
+        self.due = None
+
+    def post(self, key, func, *args):
+        # Queue func(*args) for the main loop, key=None queues it without coalescing
+        if key is None:
+            key = ('unique', next(self.unique_keys))
+        with self.lock:
+            # Re-insert so updates run in the order they were last posted
+            self.pending.pop(key, None)
+            self.pending[key] = (func, args)
+
+    def start(self):
+        self.running = True
+        self.schedule()
+
+    def schedule(self):
+        self.due = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self.drain)
+
+    def stop(self):
+        self.running = False
+
+    def drain(self):
+        # Apply everything posted since the last frame (main thread)
+        started = time.perf_counter()
+        if self.due is not None:
+            UI_LAG.observe(max(0.0, started - self.due))
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for func, args in pending.values():
+            try:
+                func(*args)
+            except Exception:
+                ERRORS.inc(where="ui_update")
+        if pending:
+            UI_DRAIN.observe(time.perf_counter() - started)
+        if self.running:
+            self.schedule()
+
+    def config(self, widget, **options):
+        # widget.config(**options), skipping options that already hold that value (main thread)
+        changed = {}
+        for option, value in options.items():
+            key = (str(widget), option)
+            if self.applied.get(key) != value:
+                self.applied[key] = value
+                changed[option] = value
+        if changed:
+            widget.config(**changed)
+
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import random
+import threading
+from collections import namedtuple
+
+from metrics import counter, histogram
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Reconnect delays grow from RECONNECT_MIN to RECONNECT_MAX seconds, each one jittered so a
+# crowd of clients does not hammer the feed in lockstep after an outage
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+# A connection that has been quiet this long is pinged, and dropped if no pong comes back
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TIMEOUT = 10
+# Messages arriving within one UI frame of each other are handed over as one batch
+BATCH_WINDOW = 0.05
+BATCH_MAX = 500
+# After a (re)connect the feed replays what it has in bursts, it counts as done once it has
+# been quiet this long
+REPLAY_QUIET = 2.0
+
+View = namedtuple('View', ['view_id', 'timestamp', 'is_new'])
+
+WS_CONNECTIONS = counter("reployer_views_connections_total", "Views WebSocket connections established")
+WS_DISCONNECTS = counter("reployer_views_disconnects_total", "Views WebSocket connections lost or refused, by error", ("error",))
+WS_MESSAGES = counter("reployer_views_messages_total", "Views WebSocket messages received, by outcome", ("outcome",))
+WS_BATCH = histogram("reployer_views_batch_size", "Messages handled per batch", buckets=(1, 2, 5, 10, 50, 100, 500), seconds=False)
+
+
+def reconnect_delay(attempt):
+    # Exponential backoff with "equal jitter": half fixed, half random
+    delay = min(RECONNECT_MAX, RECONNECT_MIN * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class ViewsClient:
+    # Follows the views WebSocket from its own thread and reports through callbacks:
+    # on_status(message), on_views([View]) once per batch of NEW_VIEW messages,
+    # on_connected() each time a connection is (re)established and on_replayed() once the
+    # replay that follows it is over
+    def __init__(self, url, on_status, on_views, on_connected=None, on_replayed=None):
+        self.url = url
+        self.on_status = on_status
+        self.on_views = on_views
+        self.on_connected = on_connected
+        self.on_replayed = on_replayed
+        self.running = False
+        self.last_view_id = None
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        asyncio.run(self.handler())
+
+    async def handler(self):
+        # Handle WebSocket connection, reconnecting with backoff
+        import websockets
+
+        attempt = 0
+        while self.running:
+            try:
+                # Liveness is checked by our own heartbeat below
+                async with websockets.connect(self.url, ping_interval=None) as websocket:
+                    self.on_status("Connected to WebSocket")
+                    WS_CONNECTIONS.inc()
+                    attempt = 0
+                    if self.on_connected is not None:
+                        self.on_connected()
+                    await self.receive(websocket)
+            except Exception as e:
+                WS_DISCONNECTS.inc(error=type(e).__name__)
+                delay = reconnect_delay(attempt)
+                attempt += 1
+                self.on_status(f"WebSocket Error: {str(e) or type(e).__name__} (retrying in {delay:.0f}s)")
+                await asyncio.sleep(delay)
+
+    async def receive(self, websocket):
+        loop = asyncio.get_running_loop()
+        replaying = True
+        while self.running:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout=REPLAY_QUIET if replaying else HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if replaying:
+                    replaying = False
+                    if self.on_replayed is not None:
+                        self.on_replayed()
+                    continue
+                # Quiet for a while, make sure the other end is still there
+                pong = await websocket.ping()
+                await asyncio.wait_for(pong, timeout=HEARTBEAT_TIMEOUT)
+                continue
+
+            # Gather whatever else arrives within the batch window (replays come in bursts)
+            batch = [message]
+            deadline = loop.time() + BATCH_WINDOW
+            while len(batch) < BATCH_MAX:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(websocket.recv(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.process_messages(batch)
+
+    def process_messages(self, messages):
+        # Process a batch of WebSocket messages, reporting the views in it at once
+        views = []
+        WS_BATCH.observe(len(messages))
+        for message in messages:
+            try:
+                data = loads(message)
+                if data.get('type') == 'NEW_VIEW':
+                    view_data = data['data']
+                    view_id = view_data['id']
+                    timestamp = view_data['timestamp']
+
+                    is_new = self.last_view_id is None or int(view_id) > int(self.last_view_id)
+                    if is_new:
+                        self.last_view_id = view_id
+                    views.append(View(view_id, timestamp, is_new))
+                    WS_MESSAGES.inc(outcome="view")
+                else:
+                    WS_MESSAGES.inc(outcome="other")
+
+            except Exception as e:
+                WS_MESSAGES.inc(outcome="error")
+                self.on_status(f"Error processing message: {str(e)}")
+        if views:
+            self.on_views(views)
@@ -0,0 +1,149 @@
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from timeseries import HISTORY_DIR
+
+# Every NEW_VIEW seen, one fixed-width record per view id in arrival order, with an in-memory
+# index by id and by time rebuilt when the file is opened
+VIEWS_FILE = "views.dat"
+
+# view id, timestamp (epoch seconds)
+VIEW_RECORD = struct.Struct('<Qd')
+
+StoredView = namedtuple('StoredView', ['view_id', 'timestamp'])
+
+
+class ViewStore:
+    # Lookups by id, by time range and for missing ids, all answered from memory. A read-only
+    # store never truncates or opens the file for writing, for queries next to a running collector
+    def __init__(self, directory=HISTORY_DIR, readonly=False):
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        self.readonly = readonly
+        self.path = os.path.join(directory, VIEWS_FILE)
+        self.lock = threading.Lock()
+        self.timestamps = {}  # view id -> timestamp
+        self.ids = []  # sorted view ids
+        self.by_time = []  # sorted (timestamp, view id)
+        self.pending = []
+        self.load()
+        self.file = None if readonly else open(self.path, 'ab')
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = len(data) - len(data) % VIEW_RECORD.size
+        if end != len(data) and not self.readonly:
+            # Drop a partially written record left by a crash
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+        for view_id, timestamp in VIEW_RECORD.iter_unpack(data[:end]):
+            self.timestamps[view_id] = timestamp
+        self.ids = sorted(self.timestamps)
+        self.by_time = sorted((timestamp, view_id) for view_id, timestamp in self.timestamps.items())
+
+    def add(self, view_id, timestamp):
+        # Store a view, returns False if the id was already known
+        view_id, timestamp = int(view_id), float(timestamp)
+        if self.readonly:
+            raise OSError(f"{self.path} is open read-only")
+        with self.lock:
+            if view_id in self.timestamps:
+                return False
+            self.timestamps[view_id] = timestamp
+            if not self.ids or view_id > self.ids[-1]:
+                self.ids.append(view_id)
+            else:
+                insort(self.ids, view_id)
+            insort(self.by_time, (timestamp, view_id))
+            self.pending.append(VIEW_RECORD.pack(view_id, timestamp))
+            return True
+
+    def flush(self):
+        if self.file is None:
+            return
+        with self.lock:
+            if self.pending:
+                self.file.write(b''.join(self.pending))
+                self.pending.clear()
+            self.file.flush()
+
+    def sync(self):
+        self.flush()
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def max_id(self):
+        with self.lock:
+            return self.ids[-1] if self.ids else None
+
+    def get(self, view_id):
+        timestamp = self.timestamps.get(int(view_id))
+        return StoredView(int(view_id), timestamp) if timestamp is not None else None
+
+    def range(self, start, end=None):
+        # Views with start <= timestamp < end, oldest first
+        with self.lock:
+            lo = bisect_left(self.by_time, (start,))
+            hi = len(self.by_time) if end is None else bisect_left(self.by_time, (end,))
+            return [StoredView(view_id, timestamp) for timestamp, view_id in self.by_time[lo:hi]]
+
+    def gaps(self, start_id=None, end_id=None):
+        # Missing id ranges as inclusive (first, last) pairs between start_id and end_id
+        with self.lock:
+            lo = 0 if start_id is None else bisect_left(self.ids, start_id)
+            hi = len(self.ids) if end_id is None else bisect_right(self.ids, end_id)
+            ids = self.ids[lo:hi]
+        return [(a + 1, b - 1) for a, b in zip(ids, ids[1:]) if b - a > 1]
+
+
+def format_gaps(gaps):
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in gaps)
+
+
+def main(argv=None):
+    # python viewstore.py get <view id> [history_dir]
+    # python viewstore.py range <start epoch> <end epoch> [history_dir]
+    # python viewstore.py gaps [history_dir]
+    argv = sys.argv[1:] if argv is None else argv
+    usage = "Usage: viewstore.py get <id> | range <start> <end> | gaps [history_dir]"
+    counts = {"get": 2, "range": 3, "gaps": 1}
+    if not argv or argv[0] not in counts or len(argv) < counts[argv[0]]:
+        print(usage)
+        return 2
+    n = counts[argv[0]]
+    store = ViewStore(argv[n] if len(argv) > n else HISTORY_DIR, readonly=True)
+    try:
+        if argv[0] == "get":
+            view = store.get(argv[1])
+            if view is None:
+                print(f"View {argv[1]} is not in the store")
+                return 1
+            print(f"{view.view_id} {view.timestamp}")
+        elif argv[0] == "range":
+            for view in store.range(float(argv[1]), float(argv[2])):
+                print(f"{view.view_id} {view.timestamp}")
+        else:
+            gaps = store.gaps()
+            print(f"{len(store)} views stored, missing: {format_gaps(gaps) if gaps else 'none'}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
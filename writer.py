@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+
+from metrics import counter, histogram
+
+# Write-behind logging: callers queue writes and return at once, a dedicated thread applies
+# them and flushes the targets in batches
+
+MAX_PENDING = 1000
+FLUSH_EVERY = 12
+FLUSH_INTERVAL = 30
+# When to fsync the targets: "flush" after every flush, "close" only when closing, "never"
+FSYNC_POLICIES = ("flush", "close", "never")
+DEFAULT_FSYNC = "flush"
+
+WRITE_LATENCY = histogram("reployer_write_seconds", "Time to apply one queued history write", ("target",))
+FLUSH_LATENCY = histogram("reployer_flush_seconds", "Time to flush (or fsync) all history files", ("sync",))
+WRITES_DROPPED = counter("reployer_writes_dropped_total", "History writes dropped because the queue was full")
+WRITES_FAILED = counter("reployer_writes_failed_total", "History writes and flushes that raised")
+
+_STOP = object()
+
+
+def target_name(func):
+    # Metric label for a queued write, e.g. "TimeSeriesStore.append"
+    return getattr(func, '__qualname__', None) or type(func).__name__
+
+
+class WriteBehind:
+    # Applies queued writes on its own thread. `targets` are objects with flush() and sync() that
+    # the writes end up in. A full queue drops the write instead of blocking the caller, and
+    # every drop or failure is counted
+    def __init__(self, targets, max_pending=MAX_PENDING, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL, fsync=DEFAULT_FSYNC):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        self.targets = list(targets)
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.thread = None
+        self.unflushed = 0
+        self.next_flush = time.monotonic() + flush_interval
+        # Counters, read from any thread
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args):
+        # Queue func(*args), returns False when it had to be dropped
+        try:
+            self.queue.put_nowait((func, args))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            WRITES_DROPPED.inc()
+            return False
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, self.next_flush - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                self.write(*item)
+            if self.unflushed >= self.flush_every or time.monotonic() >= self.next_flush:
+                self.flush(self.fsync == "flush")
+
+    def write(self, func, args):
+        started = time.perf_counter()
+        try:
+            func(*args)
+            self.written += 1
+            self.unflushed += 1
+        except Exception as e:
+            self.failed += 1
+            self.last_error = e
+            WRITES_FAILED.inc()
+        WRITE_LATENCY.observe(time.perf_counter() - started, target=target_name(func))
+
+    def flush(self, sync=False):
+        started = time.perf_counter()
+        for target in self.targets:
+            try:
+                if sync:
+                    target.sync()
+                else:
+                    target.flush()
+            except Exception as e:
+                self.failed += 1
+                self.last_error = e
+                WRITES_FAILED.inc()
+        FLUSH_LATENCY.observe(time.perf_counter() - started, sync=str(sync).lower())
+        self.flushes += 1
+        self.unflushed = 0
+        self.next_flush = time.monotonic() + self.flush_interval
+
+    def close(self, timeout=5):
+        # Write out everything still queued and flush, called before the targets are closed
+        if self.thread is not None and self.thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                # Stuck on a write, leave the rest to it rather than racing it
+                return
+        # Anything left (writer never started) is written from this thread
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self.write(*item)
+        self.flush(self.fsync != "never")
+
+    def counters(self):
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'pending': self.queue.qsize(),
+            'flushes': self.flushes,
+            'last_error': str(self.last_error) if self.last_error else None,
+        }